@@ -1,10 +1,33 @@
+import os
+import threading
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Optional, Tuple
+
+from requests import Session
 
 from src.audio import generate_voice_over
+from src.cache import DiskCache
 from src.config import cfg
+from src.footage_library import FootageLibrary
+from src.http_session import create_session, get_connection_stats
 from src.logger import logger
-from src.openai_generation import run_openai_generation
+from src.openai_generation import (
+    GenerationStats,
+    reduce_input,
+    run_concurrent_generation,
+    run_openai_generation,
+    stream_openai_generation,
+)
+from src.pipeline import Pipeline, Stage
+from src.prefetch import ScriptPrefetcher
+from src.render import render_preview, render_video
+from src.timeline import build_timeline, load_plan, save_plan
+from src.timeline_export import export_timeline
 from src.utils import (
+    Elem,
+    ScriptParser,
     generate_video_meta,
     get_cookies,
     get_source_files,
@@ -15,57 +38,330 @@ from src.utils import (
 from src.video import get_audio, get_stock_videos, make_video
 from src.video_processing import save_videos
 
-cookies = get_cookies()
+
+@dataclass
+class Resources:
+    cookies: dict
+    session: Session
+    search_cache: Optional[DiskCache] = None
+    openai_cache: Optional[DiskCache] = None
+    tts_cache: Optional[DiskCache] = None
+    library: Optional[FootageLibrary] = None
+
+
+_resources: Optional[Resources] = None
+_resources_lock = threading.Lock()
+
+
+def get_resources() -> Resources:
+    """
+    Get the cookies, HTTP session, caches and footage library shared by all stages.
+
+    They are created on the first call rather than at import, so processes importing
+    this module, e.g. spawned TTS workers, don't read cookies or open the caches.
+    """
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            cookies = get_cookies()
+            _resources = Resources(
+                cookies,
+                create_session(
+                    cookies,
+                    cfg.HTTP_POOL_SIZE,
+                    cfg.HTTP_RETRIES,
+                    cfg.HTTP_BACKOFF_FACTOR,
+                ),
+                search_cache=(
+                    DiskCache(
+                        cfg.SEARCH_CACHE_PATH,
+                        cfg.SEARCH_CACHE_TTL,
+                        cfg.SEARCH_CACHE_MAX_BYTES,
+                    )
+                    if cfg.SEARCH_CACHE_PATH
+                    else None
+                ),
+                openai_cache=(
+                    DiskCache(
+                        cfg.OPENAI_CACHE_PATH, max_bytes=cfg.OPENAI_CACHE_MAX_BYTES
+                    )
+                    if cfg.OPENAI_CACHE_PATH
+                    else None
+                ),
+                tts_cache=(
+                    DiskCache(cfg.TTS_CACHE_PATH, max_bytes=cfg.TTS_CACHE_MAX_BYTES)
+                    if cfg.TTS_CACHE_PATH
+                    else None
+                ),
+                library=(
+                    FootageLibrary(
+                        cfg.FOOTAGE_LIBRARY_DIR, cfg.FOOTAGE_LIBRARY_MAX_BYTES
+                    )
+                    if cfg.FOOTAGE_LIBRARY_DIR
+                    else None
+                ),
+            )
+        return _resources
+
+
+@dataclass
+class Job:
+    file_path: Path
+    file_output_dir: str
+    elements: list[Elem] = field(default_factory=list)
+    audio_duration: Optional[float] = None
+    prefetch: list[Future] = field(default_factory=list)
+    # stats of the chosen script, empty if it was cached
+    script_stats: GenerationStats = field(default_factory=GenerationStats)
+
+    def __str__(self):
+        return str(self.file_path)
 
 
-def run(file_path: Path):
+def write_script(file_path: Path) -> Job:
     # read data from txt file
     input_data: str = read_data_from_file(file_path)
     logger.info("Input data loaded")
+    resources = get_resources()
+    input_data = reduce_input(
+        input_data,
+        cfg.OPENAI_MAX_INPUT_TOKENS,
+        cfg.OPENAI_CHUNK_TOKENS,
+        cfg.OPENAI_SUMMARY_TOKENS,
+        cfg.SUMMARY_WORKERS,
+        resources.openai_cache,
+        cfg.OPENAI_CACHE_BYPASS,
+    )
+    job = Job(file_path, f"{cfg.PROCESS_DIR}/{file_path.stem}")
     # run openai prompt with file
-    openai_output = ""
-    for _ in range(3):
-        cur_output = run_openai_generation(input_data, "prompt.txt")
-        cur_output = cur_output.replace('"', "").replace("'", "")
-        if len(cur_output.split()) > len(openai_output.split()):
-            openai_output = cur_output
-        if len(openai_output.split()) >= 500:
-            break
+    if cfg.SCRIPT_GENERATION_MODE == "concurrent":
+        openai_output, _ = run_concurrent_generation(
+            input_data,
+            "prompt.txt",
+            cfg.SCRIPT_CANDIDATES,
+            cfg.SCRIPT_MIN_WORDS,
+            resources.openai_cache,
+            cfg.OPENAI_CACHE_BYPASS,
+            job.script_stats,
+        )
+        openai_output = openai_output.replace('"', "").replace("'", "")
+    else:
+        openai_output = ""
+        best_prefetcher = None
+        for attempt in range(cfg.SCRIPT_CANDIDATES):
+            prefetcher = None
+            stats = GenerationStats()
+            if cfg.SCRIPT_PREFETCH:
+                cur_output, prefetcher = _stream_script(input_data, attempt, stats)
+            else:
+                cur_output = run_openai_generation(
+                    input_data,
+                    "prompt.txt",
+                    attempt,
+                    resources.openai_cache,
+                    cfg.OPENAI_CACHE_BYPASS,
+                    stats,
+                )
+            cur_output = cur_output.replace('"', "").replace("'", "")
+            if len(cur_output.split()) > len(openai_output.split()):
+                openai_output = cur_output
+                job.script_stats = stats
+                # the work of a discarded script is never used
+                if best_prefetcher is not None:
+                    best_prefetcher.cancel()
+                best_prefetcher = prefetcher
+            elif prefetcher is not None:
+                prefetcher.cancel()
+            if len(openai_output.split()) >= cfg.SCRIPT_MIN_WORDS:
+                break
+        if best_prefetcher is not None:
+            job.prefetch = best_prefetcher.futures
     logger.info("OpenAI response received")
     # split data into pieces
-    splitted_output = split_openai_output(openai_output)
-
-    file_output_dir = f"{cfg.PROCESS_DIR}/{file_path.stem}"
+    job.elements = split_openai_output(openai_output)
     # save video metadata into folder
-    generate_video_meta(splitted_output, file_output_dir)
+    generate_video_meta(job.elements, job.file_output_dir)
+    return job
+
+
+def _stream_script(
+    input_data: str, attempt: int, stats: Optional[GenerationStats] = None
+) -> Tuple[str, ScriptPrefetcher]:
+    """
+    Generate a script, prefetching its footage searches and voice-over as sections arrive.
+
+    :param stats: Filled with the stats of the stream.
+    :return: Text of the script and its prefetcher, to cancel if the script is discarded.
+    """
+    resources = get_resources()
+    chunks = []
+    parser = ScriptParser()
+    prefetcher = ScriptPrefetcher(
+        resources.cookies,
+        cfg.YT_PROBA,
+        resources.session,
+        resources.search_cache,
+        resources.tts_cache,
+    )
+    try:
+        stream = stream_openai_generation(
+            input_data,
+            "prompt.txt",
+            attempt,
+            resources.openai_cache,
+            cfg.OPENAI_CACHE_BYPASS,
+            stats,
+        )
+        for chunk in stream:
+            chunk = chunk.replace('"', "").replace("'", "")
+            chunks.append(chunk)
+            for elem in parser.feed(chunk):
+                prefetcher.add(elem)
+        for elem in parser.close():
+            prefetcher.add(elem)
+    except BaseException:
+        prefetcher.cancel()
+        raise
+    prefetcher.close()
+    return "".join(chunks), prefetcher
+
+
+def voice_over(job: Job) -> Job:
+    resources = get_resources()
+    # sentences synthesized ahead are served from the TTS cache
+    wait(job.prefetch)
+    job.audio_duration = generate_voice_over(
+        job.elements, job.file_output_dir, resources.tts_cache
+    )
+    return job
 
-    # generate audio
-    audio_duration = generate_voice_over(splitted_output, file_output_dir)
 
+def collect_footage(job: Job) -> Job:
+    resources = get_resources()
     # save videos for further use
-    save_videos(splitted_output, audio_duration, file_output_dir, cookies, cfg.YT_PROBA)
+    save_videos(
+        job.elements,
+        job.audio_duration,
+        job.file_output_dir,
+        resources.cookies,
+        cfg.YT_PROBA,
+        cfg.STORYBLOCKS_WORKERS,
+        cfg.YT_WORKERS,
+        resources.session,
+        resources.search_cache,
+        resources.library,
+    )
+    return job
+
+
+def render(job: Job) -> Job:
+    if not cfg.RENDER_VIDEO and not cfg.TIMELINE_EXPORT:
+        return job
+    audio_path = get_audio(job.file_output_dir)
+    video_paths = get_stock_videos(f"{job.file_output_dir}/videos")
+    profile = cfg.get_encode_profile()
+    timeline = None
+    if cfg.TIMELINE_EXPORT:
+        timeline = build_timeline(job.elements, audio_path, video_paths)
+        export_timeline(
+            timeline,
+            audio_path,
+            f"{job.file_output_dir}/timeline.{cfg.TIMELINE_EXPORT}",
+            round(profile.fps),
+            profile.size,
+        )
+    if not cfg.RENDER_VIDEO:
+        return job
+    output_path = f"{cfg.OUTPUT_DIR}/{job.file_path.stem}"
+    if cfg.RENDER_ENGINE == "moviepy" and cfg.RENDER_MODE == "final":
+        make_video(job.elements, audio_path, video_paths, f"{output_path}.mp4", profile)
+        return job
+    if timeline is None:
+        timeline = build_timeline(job.elements, audio_path, video_paths)
+    if cfg.RENDER_MODE == "plan":
+        save_plan(
+            timeline,
+            audio_path,
+            f"{cfg.PLAN_DIR}/{job.file_path.stem}/plan.json",
+            copy_media=True,
+        )
+    elif cfg.RENDER_MODE == "preview":
+        render_preview(
+            timeline,
+            audio_path,
+            f"{output_path}.preview.mp4",
+            cfg.get_encode_profile("preview"),
+        )
+    else:
+        render_video(
+            timeline,
+            audio_path,
+            f"{output_path}.mp4",
+            profile,
+            cfg.RENDER_SEGMENT_WORKERS,
+        )
+    return job
+
+
+def render_plans() -> None:
+    """
+    Render the plans saved in `PLAN_DIR` by the "plan" render mode.
+    """
+    plan_paths = sorted(Path(cfg.PLAN_DIR).glob("*/plan.json"))
+    logger.info(f"Rendering {len(plan_paths)} plans")
+    os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
+    for plan_path in plan_paths:
+        try:
+            timeline, audio_path = load_plan(plan_path)
+            render_video(
+                timeline,
+                audio_path,
+                f"{cfg.OUTPUT_DIR}/{plan_path.parent.name}.mp4",
+                cfg.get_encode_profile(),
+                cfg.RENDER_SEGMENT_WORKERS,
+            )
+        except Exception as e:
+            logger.error(f"Failed to render {plan_path}: {e}")
+
 
-    # generate video
-    # make_video(
-    #     splitted_output,
-    #     get_audio(file_output_dir),
-    #     get_stock_videos(f"{file_output_dir}/videos"),
-    #     f"{OUTPUT_DIR}/{file_path.stem}.mp4",
-    # )
+def run(file_path: Path) -> Job:
+    return render(collect_footage(voice_over(write_script(file_path))))
 
 
 def main():
     logger.info("App start")
+    if cfg.RENDER_PLANS:
+        render_plans()
+        return
+    # fail on missing cookies or unusable caches before any file is processed
+    resources = get_resources()
     prep_directories()
-    for file_path in get_source_files(cfg.SOURCE_DIR):
-        logger.info(f"Processing: {file_path}")
-        run_completed = False
-        while not run_completed:
-            # try:
-            run(file_path)
-            run_completed = True
-            # except Exception as e:
-            #     print("Failed on file ", file_path, " with exception ", e)
+    source_files = get_source_files(cfg.SOURCE_DIR)
+    logger.info(f"Processing {len(source_files)} files")
+    pipeline = Pipeline(
+        [
+            Stage("script", write_script, cfg.SCRIPT_WORKERS, cfg.PIPELINE_RETRIES),
+            Stage(
+                "voice-over", voice_over, cfg.VOICE_OVER_WORKERS, cfg.PIPELINE_RETRIES
+            ),
+            Stage(
+                "footage", collect_footage, cfg.FOOTAGE_WORKERS, cfg.PIPELINE_RETRIES
+            ),
+            Stage("render", render, cfg.RENDER_WORKERS, cfg.PIPELINE_RETRIES),
+        ],
+        queue_size=cfg.PIPELINE_QUEUE_SIZE,
+    )
+    done = pipeline.run(source_files)
+    logger.info(f"Processed {len(done)}/{len(source_files)} files")
+    generated = [job.script_stats for job in done if job.script_stats.tokens]
+    if generated:
+        tokens = sum(stats.tokens for stats in generated)
+        duration = sum(stats.duration for stats in generated)
+        logger.info(
+            f"Scripts: {len(generated)} generated, {tokens} tokens "
+            f"at {tokens / duration if duration else 0.0:.1f} tokens/s"
+        )
+    logger.info(f"Storyblocks connections: {get_connection_stats(resources.session)}")
 
 
 if __name__ == "__main__":
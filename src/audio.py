@@ -1,51 +1,166 @@
-import nltk
+import json
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
 import numpy as np
 import soundfile as sf
-from bark import SAMPLE_RATE
-from bark.api import semantic_to_waveform
-from bark.generation import generate_text_semantic, preload_models
 
+from src.cache import DiskCache
+from src.config import cfg
 from src.logger import logger
+from src.utils import TIMINGS_FILE
+
+if TYPE_CHECKING:
+    from src.bark_engine import BarkEngine
+
+GEN_TEMP = 0.7
+SPEAKER = "v2/en_speaker_2"
+MIN_EOS_P = 0.05  # this controls how likely the generation is to end
+SAMPLE_RATE = 24_000  # sample rate of Bark audio
+SILENCE_DURATION = 0.25  # pause after every sentence, seconds
+
+_engine: Optional["BarkEngine"] = None
+_engine_lock = threading.Lock()
 
-nltk.download("punkt")
 
+def get_tts_engine(cache: Optional[DiskCache] = None) -> "BarkEngine":
+    """
+    Get the process-wide TTS engine.
+
+    The engine is created and its models are loaded on the first call, later calls
+    return the same engine, so the models stay resident between files.
+    Bark and torch are imported here rather than at module import, so processes
+    which never synthesize audio don't pay for them.
 
-def generate_voice_over(splitted_output: list, output_dir: str) -> float:
+    :param cache: Cache of sentence waveforms, used when the engine is created.
+    :return: Loaded `BarkEngine`.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            start = time.perf_counter()
+            from src.bark_engine import BarkEngine
+
+            engine = BarkEngine(
+                batch_size=cfg.TTS_BATCH_SIZE,
+                device=cfg.TTS_DEVICE,
+                threads=cfg.TTS_THREADS,
+                small_models=cfg.TTS_SMALL_MODELS,
+                cache=cache,
+                workers=cfg.TTS_WORKERS,
+            )
+            engine.load()
+            _ensure_punkt()
+            startup = time.perf_counter() - start
+            logger.info(f"TTS engine loaded in {startup:.1f}s")
+            if startup > cfg.TTS_STARTUP_BUDGET:
+                logger.warning(
+                    f"TTS engine startup took {startup:.1f}s, "
+                    f"over the {cfg.TTS_STARTUP_BUDGET:.0f}s budget"
+                )
+            _engine = engine
+        return _engine
+
+
+def _ensure_punkt() -> None:
+    import nltk
+
+    try:
+        nltk.data.find("tokenizers/punkt")
+    except LookupError:
+        # offline workers need punkt installed in advance
+        nltk.download("punkt", quiet=True)
+
+
+def generate_voice_over(
+    splitted_output: list, output_dir: str, cache: Optional[DiskCache] = None
+) -> float:
     """
     Generate voice-over audio from the given `splitted_output` and save it as a WAV file.
 
     :param splitted_output: A list of items representing the splitted output.
     :param output_dir: The output directory where the voice-over WAV file will be saved.
+    :param cache: Cache of sentence waveforms, only new or edited sentences are synthesized.
     :return: The duration of the generated voice-over audio in frames.
     """
+    import nltk
+
     logger.info("Generate voiceover")
-    preload_models()
-    output_text = " ".join(
-        (item.text for item in splitted_output if item.type == "text")
-    )
-    sentences = nltk.sent_tokenize(output_text)
-
-    GEN_TEMP = 0.7
-    SPEAKER = "v2/en_speaker_2"
-    silence = np.zeros(int(0.25 * SAMPLE_RATE))  # quarter second of silence
-    pieces = []
-    for sentence in sentences:
-        semantic_tokens = generate_text_semantic(
-            sentence,
-            history_prompt=SPEAKER,
-            temp=GEN_TEMP,
-            min_eos_p=0.05,  # this controls how likely the generation is to end
-        )
+    engine = get_tts_engine(cache)
+    paragraphs = [
+        nltk.sent_tokenize(item.text) for item in splitted_output if item.type == "text"
+    ]
+    sentences = [sentence for paragraph in paragraphs for sentence in paragraph]
 
-        audio_array = semantic_to_waveform(
-            semantic_tokens,
-            history_prompt=SPEAKER,
-        )
-        pieces += [audio_array, silence.copy()]
-    output = np.concatenate(pieces)
     file_path = f"{output_dir}/voiceover.wav"
-    sf.write(file_path, output, SAMPLE_RATE)
+    duration, offsets = write_audio_stream(engine.synthesize(sentences), file_path)
+    save_timings(paragraphs, offsets, round(duration * SAMPLE_RATE), file_path)
     logger.info(f"Voice over saved OK {file_path}")
-    # calculate duration
-    temp = sf.SoundFile(file_path)
-    return temp.frames / temp.samplerate
+    return duration
+
+
+def write_audio_stream(
+    audio_arrays: Iterable[np.ndarray], file_path: str
+) -> Tuple[float, List[Tuple[int, int]]]:
+    """
+    Write sentence audio to a WAV file as it is produced, with a pause after every sentence.
+
+    :param audio_arrays: Audio of every sentence.
+    :param file_path: Path of the WAV file.
+    :return: Duration of the audio in seconds and (start, end) sample of every sentence.
+    """
+    silence = np.zeros(int(SILENCE_DURATION * SAMPLE_RATE), dtype=np.float32)
+    offsets = []
+    n_samples = 0
+    with sf.SoundFile(file_path, "w", samplerate=SAMPLE_RATE, channels=1) as f:
+        for audio_array in audio_arrays:
+            f.write(audio_array)
+            offsets.append((n_samples, n_samples + len(audio_array)))
+            f.write(silence)
+            n_samples += len(audio_array) + len(silence)
+    return n_samples / SAMPLE_RATE, offsets
+
+
+def save_timings(
+    paragraphs: List[List[str]],
+    offsets: List[Tuple[int, int]],
+    n_samples: int,
+    audio_path: str,
+) -> None:
+    """
+    Save the timing map of the voice-over next to the audio file, see `src.utils.load_timings`.
+
+    A paragraph lasts from its first sentence to the first sentence of the next paragraph,
+    so paragraphs cover the whole audio including the pauses.
+
+    :param paragraphs: Sentences of every paragraph.
+    :param offsets: (start, end) sample of every sentence, as returned by `write_audio_stream`.
+    :param n_samples: Total number of samples of the audio.
+    :param audio_path: Path to the voice-over audio.
+    """
+    timings = []
+    n_sentence = 0
+    for paragraph in paragraphs:
+        sentences = []
+        for text in paragraph:
+            start, end = offsets[n_sentence]
+            sentences.append({"text": text, "start": start, "end": end})
+            n_sentence += 1
+        start = sentences[0]["start"] if sentences else None
+        timings.append({"start": start, "sentences": sentences})
+    next_start = n_samples
+    for paragraph in reversed(timings):
+        if paragraph["start"] is None:
+            paragraph["start"] = next_start
+        paragraph["end"] = next_start
+        next_start = paragraph["start"]
+
+    with open(Path(audio_path).with_name(TIMINGS_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {"sample_rate": SAMPLE_RATE, "samples": n_samples, "paragraphs": timings},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
@@ -0,0 +1,330 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from bark import generation
+from bark.api import semantic_to_waveform
+from bark.generation import generate_text_semantic, preload_models
+
+from src.audio import GEN_TEMP, MIN_EOS_P, SPEAKER
+from src.cache import DiskCache
+from src.logger import logger
+
+MAX_SEMANTIC_STEPS = 768
+# sentences are sorted by length inside windows of `batch_size * BATCH_WINDOW` sentences,
+# which bounds how many finished sentences wait for the earlier ones
+BATCH_WINDOW = 4
+
+_worker_engine: Optional["BarkEngine"] = None
+
+
+class BarkEngine:
+    """
+    Text-to-speech with Bark.
+
+    With `batch_size` > 1 sentences of similar token length are grouped together and
+    their semantic tokens are generated in a single batched forward pass per step.
+    Coarse/fine generation and decoding depend on the sentence length and run per sentence.
+    With a `cache` the waveform of every sentence is stored, so unchanged sentences
+    are never synthesized twice.
+    With `workers` > 1 sentences are sharded across worker processes, each with its own
+    resident models, which keeps all cores busy on CPU-only machines.
+    """
+
+    def __init__(
+        self,
+        speaker: str = SPEAKER,
+        temp: float = GEN_TEMP,
+        min_eos_p: float = MIN_EOS_P,
+        batch_size: int = 1,
+        device: str = "auto",
+        threads: Optional[int] = None,
+        small_models: bool = False,
+        cache: Optional[DiskCache] = None,
+        workers: int = 1,
+    ):
+        """
+        :param speaker: Bark history prompt.
+        :param temp: Generation temperature of semantic tokens.
+        :param min_eos_p: Probability of the end token to stop the sentence generation.
+        :param batch_size: Number of sentences generated together.
+        :param device: "auto" to use a GPU when available or "cpu".
+        :param threads: Number of torch CPU threads, torch default if None.
+        :param small_models: Use the small Bark models, faster but lower quality.
+        :param cache: Cache of sentence waveforms.
+        :param workers: Number of synthesis processes, 1 synthesizes in this process.
+        """
+        self.speaker = speaker
+        self.temp = temp
+        self.min_eos_p = min_eos_p
+        self.batch_size = batch_size
+        self.device = device
+        self.threads = threads
+        self.small_models = small_models
+        self.cache = cache
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # models are shared, in-process generation runs one at a time
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        if self.workers > 1:
+            self._start_pool()
+            return
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        use_gpu = self.device != "cpu"
+        preload_models(
+            text_use_gpu=use_gpu,
+            text_use_small=self.small_models,
+            coarse_use_gpu=use_gpu,
+            coarse_use_small=self.small_models,
+            fine_use_gpu=use_gpu,
+            fine_use_small=self.small_models,
+            codec_use_gpu=use_gpu,
+        )
+
+    def synthesize(self, sentences: List[str]) -> Iterator[np.ndarray]:
+        """
+        Generate audio for every sentence.
+
+        :param sentences: Sentences to voice.
+        :return: Iterator over audio arrays, in order of `sentences`.
+        """
+        cached = set()
+        if self.cache is not None:
+            # arrays are loaded one at a time when they are yielded
+            cached = {
+                i
+                for i, sentence in enumerate(sentences)
+                if self.cache.contains(self._cache_key(sentence))
+            }
+            logger.info(f"TTS cache: {len(cached)}/{len(sentences)} sentences cached")
+        missing = [i for i in range(len(sentences)) if i not in cached]
+        generated = self._generate([sentences[i] for i in missing])
+        for i, sentence in enumerate(sentences):
+            if i in cached:
+                value = self.cache.get(self._cache_key(sentence))
+                if value is not None:
+                    yield np.load(io.BytesIO(value))
+                    continue
+                # evicted since the lookup
+                audio_array = next(self._generate([sentence]))
+            else:
+                audio_array = next(generated)
+            if self.cache is not None:
+                buffer = io.BytesIO()
+                np.save(buffer, audio_array)
+                self.cache.set(self._cache_key(sentence), buffer.getvalue())
+            yield audio_array
+
+    def _cache_key(self, sentence: str) -> str:
+        return DiskCache.make_key(
+            "tts",
+            " ".join(sentence.split()),
+            self.speaker,
+            self.temp,
+            self.min_eos_p,
+            self.small_models,
+        )
+
+    def _start_pool(self) -> None:
+        # split the cores between workers unless the thread count is set explicitly
+        threads = self.threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            # fork is unsafe with torch threads and CUDA
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                dict(
+                    speaker=self.speaker,
+                    temp=self.temp,
+                    min_eos_p=self.min_eos_p,
+                    batch_size=self.batch_size,
+                    device=self.device,
+                    threads=threads,
+                    small_models=self.small_models,
+                ),
+            ),
+        )
+        # start the workers and wait for their models to load
+        list(self._pool.map(_worker_ready, range(self.workers)))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _generate(self, sentences: List[str]) -> Iterator[np.ndarray]:
+        if self._pool is not None:
+            # a shard is one sentence, or a window of sentences to batch by length
+            shard_size = 1 if self.batch_size <= 1 else self.batch_size * BATCH_WINDOW
+            shards = [
+                sentences[i : i + shard_size]
+                for i in range(0, len(sentences), shard_size)
+            ]
+            for audio_arrays in self._pool.map(_worker_generate, shards):
+                yield from audio_arrays
+            return
+
+        with self._lock:
+            yield from self._generate_locally(sentences)
+
+    def _generate_locally(self, sentences: List[str]) -> Iterator[np.ndarray]:
+        if self.batch_size <= 1:
+            for sentence in sentences:
+                semantic_tokens = generate_text_semantic(
+                    sentence,
+                    history_prompt=self.speaker,
+                    temp=self.temp,
+                    min_eos_p=self.min_eos_p,
+                )
+                yield self._to_waveform(semantic_tokens)
+            return
+
+        ready = {}
+        next_index = 0
+        for batch in self._make_batches(sentences):
+            semantic_batch = generate_text_semantic_batch(
+                [sentences[i] for i in batch],
+                history_prompt=self.speaker,
+                temp=self.temp,
+                min_eos_p=self.min_eos_p,
+            )
+            for i, semantic_tokens in zip(batch, semantic_batch):
+                ready[i] = self._to_waveform(semantic_tokens)
+            while next_index in ready:
+                yield ready.pop(next_index)
+                next_index += 1
+
+    def _to_waveform(self, semantic_tokens: np.ndarray) -> np.ndarray:
+        return semantic_to_waveform(semantic_tokens, history_prompt=self.speaker)
+
+    def _make_batches(self, sentences: List[str]) -> List[List[int]]:
+        tokenizer = generation.models["text"]["tokenizer"]
+        lengths = [len(generation._tokenize(tokenizer, s)) for s in sentences]
+        window = self.batch_size * BATCH_WINDOW
+        batches = []
+        for start in range(0, len(sentences), window):
+            indexes = sorted(
+                range(start, min(start + window, len(sentences))),
+                key=lambda i: lengths[i],
+            )
+            for n in range(0, len(indexes), self.batch_size):
+                batches.append(indexes[n : n + self.batch_size])
+        return batches
+
+
+def _init_worker(engine_kwargs: dict) -> None:
+    global _worker_engine
+    _worker_engine = BarkEngine(**engine_kwargs)
+    _worker_engine.load()
+
+
+def _worker_ready(_) -> int:
+    return os.getpid()
+
+
+def _worker_generate(sentences: List[str]) -> List[np.ndarray]:
+    return list(_worker_engine._generate_locally(sentences))
+
+
+def generate_text_semantic_batch(
+    texts: List[str],
+    history_prompt: Optional[str] = None,
+    temp: float = GEN_TEMP,
+    min_eos_p: float = MIN_EOS_P,
+    max_steps: int = MAX_SEMANTIC_STEPS,
+) -> List[np.ndarray]:
+    """
+    Batched version of `bark.generation.generate_text_semantic`.
+
+    Bark pads the text and the history to a fixed context, so all sequences of the batch
+    have the same length at every step and no attention mask is needed. Finished sequences
+    keep being fed a pad token until the whole batch is done, their output is cut at the end token.
+
+    :param texts: Sentences to generate semantic tokens for.
+    :param history_prompt: Bark history prompt.
+    :param temp: Generation temperature.
+    :param min_eos_p: Probability of the end token to stop the generation.
+    :param max_steps: Max number of generated tokens per sentence.
+    :return: Semantic tokens of every sentence.
+    """
+    model_container = generation.models["text"]
+    model, tokenizer = model_container["model"], model_container["tokenizer"]
+    if history_prompt is not None:
+        semantic_history = generation._load_history_prompt(history_prompt)[
+            "semantic_prompt"
+        ].astype(np.int64)[-256:]
+        semantic_history = np.pad(
+            semantic_history,
+            (0, 256 - len(semantic_history)),
+            constant_values=generation.SEMANTIC_PAD_TOKEN,
+        )
+    else:
+        semantic_history = np.full(256, generation.SEMANTIC_PAD_TOKEN)
+
+    rows = []
+    for text in texts:
+        encoded_text = (
+            np.array(
+                generation._tokenize(tokenizer, generation._normalize_whitespace(text))
+            )
+            + generation.TEXT_ENCODING_OFFSET
+        )[:256]
+        encoded_text = np.pad(
+            encoded_text,
+            (0, 256 - len(encoded_text)),
+            constant_values=generation.TEXT_PAD_TOKEN,
+        )
+        rows.append(
+            np.hstack(
+                [encoded_text, semantic_history, [generation.SEMANTIC_INFER_TOKEN]]
+            )
+        )
+
+    if generation.OFFLOAD_CPU:
+        model.to(generation.models_devices["text"])
+    device = next(model.parameters()).device
+    eos = generation.SEMANTIC_VOCAB_SIZE
+    lengths = [None] * len(texts)
+    done = torch.zeros(len(texts), dtype=torch.bool)
+    with generation._inference_mode():
+        x = torch.from_numpy(np.array(rows, dtype=np.int64)).to(device)
+        context_len = x.shape[1]
+        kv_cache = None
+        for step in range(max_steps):
+            x_input = x if kv_cache is None else x[:, [-1]]
+            logits, kv_cache = model(
+                x_input, merge_context=True, use_cache=True, past_kv=kv_cache
+            )
+            relevant_logits = torch.hstack(
+                (logits[:, 0, :eos], logits[:, 0, [generation.SEMANTIC_PAD_TOKEN]])
+            )
+            probs = F.softmax(relevant_logits / temp, dim=-1)
+            item_next = torch.multinomial(probs.float().cpu(), num_samples=1)
+            stop = (item_next[:, 0] == eos) | (probs[:, -1].cpu() >= min_eos_p)
+            for i in torch.nonzero(stop)[:, 0].tolist():
+                if lengths[i] is None:
+                    lengths[i] = step
+            done |= stop
+            if bool(done.all()):
+                break
+            # sampled tokens of finished rows are discarded, they are fed a pad token
+            item_next[done] = generation.SEMANTIC_PAD_TOKEN
+            x = torch.cat((x, item_next.to(device)), dim=1)
+        out = x.detach().cpu().numpy()[:, context_len:]
+    if generation.OFFLOAD_CPU:
+        model.to("cpu")
+    generation._clear_cuda_cache()
+    return [
+        row[: max_steps if length is None else length]
+        for row, length in zip(out, lengths)
+    ]
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from src.logger import logger
+
+
+class DiskCache:
+    """
+    Persistent key-value cache stored in a SQLite file.
+
+    Entries expire after `ttl` seconds and the least recently used entries are evicted
+    once the total size of stored values exceeds `max_bytes`.
+    The cache can be shared between threads and between processes.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        :param path: Path to the SQLite file, created if it doesn't exist. ":memory:" keeps the cache in RAM.
+        :param ttl: Time to live of an entry in seconds, entries never expire if None.
+        :param max_bytes: Max total size of stored values, unlimited if None.
+        """
+        if str(path) != ":memory:":
+            os.makedirs(Path(path).parent, exist_ok=True)
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                "created REAL, accessed REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+            )
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Build a cache key from JSON-serializable parts.
+
+        :return: Hex digest of the parts.
+        """
+        raw = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get the value stored under `key`.
+
+        :return: The value or None if there is no such entry or it has expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return value
+
+    def contains(self, key: str) -> bool:
+        """
+        Check if an unexpired entry is stored under `key` without reading its value.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return False
+        return self.ttl is None or time.time() - row[0] <= self.ttl
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store `value` under `key` and evict old entries if the cache is over its size.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(now)
+
+    def get_json(self, key: str):
+        """
+        Get a JSON value stored with `set_json`.
+
+        :return: Deserialized value or None if there is no such entry.
+        """
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key: str, value) -> None:
+        self.set(key, json.dumps(value).encode("utf-8"))
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+        if self.max_bytes is None:
+            return
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache ORDER BY accessed"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        logger.debug(f"Evicted {len(evicted)} entries from {self.path}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
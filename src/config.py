@@ -1,10 +1,47 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from yaml import safe_load
 
 
+@dataclass
+class EncodeProfile:
+    preset: str = "medium"
+    crf: int = 23
+    threads: int = 0  # 0 lets the encoder choose
+    fps: float = 30
+    width: int = 1920
+    height: int = 1080
+    pix_fmt: str = "yuv420p"
+    codec: str = "libx264"
+    audio_codec: str = "aac"
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def video_args(self) -> List[str]:
+        """ffmpeg output arguments of the video encoder."""
+        args = ["-c:v", self.codec, "-preset", self.preset, "-crf", str(self.crf)]
+        return args + ["-pix_fmt", self.pix_fmt, "-threads", str(self.threads)]
+
+    def scale_filter(self) -> str:
+        """ffmpeg filter fitting the video into the profile size, letterboxed."""
+        return (
+            f"scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+            f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2"
+        )
+
+
+ENCODE_PROFILES = {
+    "final": EncodeProfile(),
+    "draft": EncodeProfile(preset="veryfast", crf=28, width=1280, height=720),
+    "preview": EncodeProfile(preset="ultrafast", crf=32, fps=15, width=640, height=360),
+    "shorts": EncodeProfile(preset="medium", crf=23, width=1080, height=1920),
+}
+
+
 @dataclass
 class Config:
     OPENAI_API_KEY: str
@@ -13,6 +50,76 @@ class Config:
     PROCESS_DIR: str
     OUTPUT_DIR: str
     YT_PROBA: int
+    # script generation: sequential retries or concurrent candidates
+    SCRIPT_GENERATION_MODE: str = "sequential"
+    SCRIPT_CANDIDATES: int = 3
+    SCRIPT_MIN_WORDS: int = 500
+    SCRIPT_PREFETCH: bool = False
+    # long inputs are summarized in chunks until they fit into the script prompt
+    OPENAI_MAX_INPUT_TOKENS: int = 5000
+    OPENAI_CHUNK_TOKENS: int = 3000
+    OPENAI_SUMMARY_TOKENS: int = 500
+    SUMMARY_WORKERS: int = 4
+    STORYBLOCKS_WORKERS: int = 4
+    YT_WORKERS: int = 2
+    CLIP_EXTRACT_MODE: str = "reencode"
+    YT_DOWNLOAD_MODE: str = "full"
+    # pooled HTTP session for Storyblocks
+    HTTP_POOL_SIZE: int = 16
+    HTTP_RETRIES: int = 3
+    HTTP_BACKOFF_FACTOR: float = 0.5
+    # Storyblocks and YouTube search results cache, disabled if path is not set
+    SEARCH_CACHE_PATH: Optional[str] = None
+    SEARCH_CACHE_TTL: float = 7 * 24 * 60 * 60
+    SEARCH_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # OpenAI responses cache, disabled if path is not set
+    OPENAI_CACHE_PATH: Optional[str] = None
+    OPENAI_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    OPENAI_CACHE_BYPASS: bool = False
+    # downloaded footage reused between videos, disabled if dir is not set
+    FOOTAGE_LIBRARY_DIR: Optional[str] = None
+    FOOTAGE_LIBRARY_MAX_BYTES: int = 50 * 1024**3
+    # multi-file pipeline: worker threads per stage and queue size between stages
+    SCRIPT_WORKERS: int = 2
+    VOICE_OVER_WORKERS: int = 1
+    FOOTAGE_WORKERS: int = 2
+    RENDER_WORKERS: int = 1
+    PIPELINE_QUEUE_SIZE: int = 2
+    PIPELINE_RETRIES: int = 0
+    RENDER_VIDEO: bool = False
+    RENDER_ENGINE: str = "ffmpeg"
+    RENDER_MODE: str = "final"
+    RENDER_SEGMENT_WORKERS: int = 1
+    # plans keep their own copy of the media, keep the folder out of PROCESS_DIR and OUTPUT_DIR
+    PLAN_DIR: str = "./plans"
+    RENDER_PLANS: bool = False
+    TIMELINE_EXPORT: Optional[str] = None
+    # voice-over synthesis
+    TTS_BATCH_SIZE: int = 1
+    TTS_DEVICE: str = "auto"
+    TTS_THREADS: Optional[int] = None
+    TTS_SMALL_MODELS: bool = False
+    TTS_WORKERS: int = 1
+    TTS_STARTUP_BUDGET: float = 60.0
+    TTS_CACHE_PATH: Optional[str] = None
+    TTS_CACHE_MAX_BYTES: int = 2 * 1024**3
+    # encoding of rendered videos and re-encoded clips, a name from ENCODE_PROFILES
+    ENCODE_PROFILE: str = "final"
+    # extra or overridden profiles, e.g. {"final": {"crf": 18}}
+    ENCODE_PROFILES: Dict[str, dict] = field(default_factory=dict)
+
+    def get_encode_profile(self, name: Optional[str] = None) -> EncodeProfile:
+        """
+        Get an encode profile, built-in profiles are updated with `ENCODE_PROFILES`.
+
+        :param name: Profile name, `ENCODE_PROFILE` if None.
+        :return: The encode profile.
+        """
+        name = name or self.ENCODE_PROFILE
+        if name not in ENCODE_PROFILES and name not in self.ENCODE_PROFILES:
+            raise ValueError(f"Unknown encode profile: {name}")
+        base = ENCODE_PROFILES.get(name, EncodeProfile())
+        return replace(base, **self.ENCODE_PROFILES.get(name, {}))
 
 
 def get_config(path: Union[str, Path] = None) -> Config:
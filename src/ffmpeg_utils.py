@@ -0,0 +1,91 @@
+import re
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Union
+
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from src.logger import logger
+
+FFMPEG_BINARY = get_setting("FFMPEG_BINARY")
+
+
+def run_ffmpeg(args: List[str]) -> str:
+    """
+    Run ffmpeg with the given arguments.
+
+    :param args: ffmpeg arguments, without the binary itself.
+    :return: stderr output of ffmpeg.
+    :raises RuntimeError: If ffmpeg exits with an error.
+    """
+    cmd = [FFMPEG_BINARY, "-hide_banner", "-nostdin", "-y", *map(str, args)]
+    logger.debug(f"Run: {' '.join(cmd)}")
+    process = subprocess.run(cmd, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {process.stderr[-2000:]}")
+    return process.stderr
+
+
+def get_video_info(path: Union[str, Path]) -> dict:
+    """
+    Read duration, size and fps of a video without decoding it.
+
+    :param path: Path or URL of the video.
+    :return: A dictionary with "duration", "video_size" and "video_fps" keys.
+    """
+    infos = ffmpeg_parse_infos(str(path))
+    return {
+        "duration": infos["duration"],
+        "video_size": infos.get("video_size"),
+        "video_fps": infos.get("video_fps"),
+    }
+
+
+def get_video_codec(path: Union[str, Path]) -> Optional[str]:
+    """
+    Get the codec name of the first video stream, e.g. "h264".
+
+    :param path: Path or URL of the video.
+    :return: Codec name or None if the file has no video stream.
+    """
+    process = subprocess.run(
+        [FFMPEG_BINARY, "-hide_banner", "-nostdin", "-i", str(path)],
+        capture_output=True,
+        text=True,
+    )
+    match = re.search(r"Stream #.*?Video: (\w+)", process.stderr)
+    return match.group(1) if match else None
+
+
+def get_keyframe_times(path: Union[str, Path], start: float, end: float) -> List[float]:
+    """
+    Find keyframe timestamps of the video within [start, end).
+
+    Only keyframes are decoded, so the scan is cheap compared to full decoding.
+
+    :param path: Path to the video.
+    :param start: Start of the scanned window in seconds.
+    :param end: End of the scanned window in seconds.
+    :return: Sorted keyframe timestamps in seconds.
+    """
+    args = ["-skip_frame", "nokey", "-ss", start, "-t", end - start, "-copyts"]
+    args += ["-i", path, "-an", "-vf", "showinfo", "-f", "null", "-"]
+    stderr = run_ffmpeg(args)
+    times = (float(t) for t in re.findall(r"pts_time:([\d.]+)", stderr))
+    return sorted(t for t in times if start <= t < end)
+
+
+def write_concat_list(
+    paths: List[Union[str, Path]], list_path: Union[str, Path]
+) -> None:
+    """
+    Write a file list for the ffmpeg concat demuxer.
+
+    :param paths: Files to concatenate, in order.
+    :param list_path: Path of the list file.
+    """
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = str(Path(path).absolute()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from src.logger import logger
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class FootageLibrary:
+    """
+    Persistent content-addressed store of downloaded footage.
+
+    Files are stored once per content hash under `root/objects` and indexed by their source
+    (Storyblocks URL, YouTube video ID, ...). Requested files are hardlinked into the
+    working folders, so a clip used by many videos is downloaded and stored only once.
+    The least recently used files are removed once the library exceeds `max_bytes`.
+    """
+
+    def __init__(self, root: Union[str, Path], max_bytes: Optional[int] = None):
+        """
+        :param root: Library folder, created if it doesn't exist.
+        :param max_bytes: Max total size of stored files, unlimited if None.
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root / "objects", exist_ok=True)
+        self._lock = threading.Lock()
+        self._source_locks: Dict[str, threading.Lock] = {}
+        self._conn = sqlite3.connect(
+            str(self.root / "index.sqlite"),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, digest TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                "digest TEXT PRIMARY KEY, name TEXT, size INTEGER, accessed REAL)"
+            )
+
+    def lookup(self, source: str) -> Optional[Path]:
+        """
+        Find the stored file of the `source`.
+
+        :param source: Source key, e.g. "storyblocks:<url>" or "youtube:<video id>".
+        :return: Path to the stored file or None if the source isn't in the library.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT objects.digest, objects.name FROM sources "
+                "JOIN objects ON sources.digest = objects.digest WHERE source = ?",
+                (source,),
+            ).fetchone()
+            if row is None:
+                return None
+            digest, name = row
+            path = self.root / "objects" / name
+            if not path.exists():
+                self._conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                self._conn.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+                return None
+            self._conn.execute(
+                "UPDATE objects SET accessed = ? WHERE digest = ?",
+                (time.time(), digest),
+            )
+        return path
+
+    def add(self, source: str, path: Union[str, Path]) -> Path:
+        """
+        Store the file at `path` as the content of `source`.
+
+        The file is hardlinked into the library (copied if that isn't possible),
+        files with the same content are stored only once.
+
+        :param source: Source key of the file.
+        :param path: Path to the downloaded file.
+        :return: Path to the stored file.
+        """
+        digest = _file_digest(path)
+        name = f"{digest[:2]}/{digest}{Path(path).suffix}"
+        object_path = self.root / "objects" / name
+        if not object_path.exists():
+            os.makedirs(object_path.parent, exist_ok=True)
+            # unique per call, the same clip can be added by several threads at once
+            fd, tmp_path = tempfile.mkstemp(
+                ".tmp", object_path.name, object_path.parent
+            )
+            os.close(fd)
+            try:
+                _link_or_copy(path, tmp_path)
+                os.replace(tmp_path, object_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                (digest, name, object_path.stat().st_size, time.time()),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, digest)
+            )
+            self._evict()
+        return object_path
+
+    def fetch(
+        self,
+        source: str,
+        path: Union[str, Path],
+        download: Callable[[Union[str, Path]], None],
+    ) -> None:
+        """
+        Put the file of `source` at `path`, downloading it only if it isn't in the library.
+
+        Concurrent fetches of the same source wait for each other, so the source is
+        downloaded once.
+
+        :param source: Source key of the file.
+        :param path: Destination path.
+        :param download: Function saving the file to the given path.
+        """
+        with self._lock:
+            source_lock = self._source_locks.setdefault(source, threading.Lock())
+        with source_lock:
+            stored_path = self.lookup(source)
+            if stored_path is not None:
+                try:
+                    _link_or_copy(stored_path, path)
+                    logger.info(f"Footage library hit: {source}")
+                    return
+                except FileNotFoundError:
+                    # evicted in the meantime
+                    pass
+            download(path)
+            self.add(source, path)
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM objects"
+        ).fetchone()
+        for digest, name, size in self._conn.execute(
+            "SELECT digest, name, size FROM objects ORDER BY accessed"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.root / "objects" / name)
+            except FileNotFoundError:
+                pass
+            self._conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            self._conn.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+            total -= size
+            logger.debug(f"Evicted {name} from footage library")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _file_digest(path: Union[str, Path]) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _link_or_copy(src: Union[str, Path], dst: Union[str, Path]) -> None:
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # different file systems or no hardlink support
+        shutil.copyfile(src, dst)
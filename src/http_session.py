@@ -0,0 +1,62 @@
+from typing import Optional
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_session(
+    cookies: Optional[dict] = None,
+    pool_size: int = 10,
+    retries: int = 3,
+    backoff_factor: float = 0.5,
+) -> Session:
+    """
+    Create an HTTP session with keep-alive connection pools and retries.
+
+    :param cookies: Cookies sent with every request of the session.
+    :param pool_size: Max number of connections kept alive per host.
+    :param retries: Number of retries on connection errors and 429/5xx responses.
+    :param backoff_factor: Backoff factor between retries, sleeps `backoff_factor * 2 ** (retry - 1)` seconds.
+    :return: Configured `requests.Session`.
+    """
+    session = Session()
+    if cookies:
+        session.cookies.update(cookies)
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        # return the last response and let the caller check its status
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_connection_stats(session: Session) -> dict:
+    """
+    Count connections opened and reused by the session so far.
+
+    Only connection pools currently held by the session are counted.
+
+    :param session: Session created by `create_session`.
+    :return: A dictionary with "requests", "opened" and "reused" counters.
+    """
+    n_requests = opened = 0
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            n_requests += pool.num_requests
+            opened += pool.num_connections
+    return {"requests": n_requests, "opened": opened, "reused": n_requests - opened}
@@ -1,24 +1,77 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
 
 import openai
 
+from src.cache import DiskCache
 from src.config import cfg
+from src.http_session import create_session
 from src.logger import logger
+from src.tokens import count_tokens, split_by_tokens
+from src.utils import is_valid_script
+
+_prompts: Dict[str, Tuple[float, str]] = {}
+_generators: Dict[Tuple[str, str, int], "Openai"] = {}
+_lock = threading.Lock()
+MAX_TOKENS = 1500
+BUNDLED_PROMPTS_PATH = Path(__file__).parent.parent / "prompts"
+SECTION_SEP = "###"
+
+
+@dataclass
+class GenerationStats:
+    time_to_first_token: Optional[float] = None  # seconds
+    duration: float = 0.0  # seconds
+    tokens: int = 0  # streamed chunks, one token each
+    prompt_tokens: int = 0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.duration if self.duration else 0.0
 
 
 class Openai:
-    def __init__(self, key="", prompt="", model="gpt-4"):
+    def __init__(self, key="", prompt="", model="gpt-4", max_tokens=MAX_TOKENS):
         self.set_openai_key(key)
-        self.system_prompt = self.get_system_prompt(
-            f"{cfg.OPENAI_PROMPTS_PATH}/{prompt}"
-        )
+        self.prompt_path = f"{cfg.OPENAI_PROMPTS_PATH}/{prompt}"
+        if (
+            not os.path.exists(self.prompt_path)
+            and (BUNDLED_PROMPTS_PATH / prompt).exists()
+        ):
+            # custom prompt folders may lack the prompts added later, like summarize.txt
+            logger.info(
+                f"{prompt} not found in {cfg.OPENAI_PROMPTS_PATH}, using the bundled one"
+            )
+            self.prompt_path = str(BUNDLED_PROMPTS_PATH / prompt)
         self.model = model
+        self.max_tokens = max_tokens
         logger.info(f"OpenAI model initialized. Model: {model}. Prompt: {prompt}")
 
+    @property
+    def system_prompt(self) -> str:
+        return self.get_system_prompt(self.prompt_path)
+
     @staticmethod
     def get_system_prompt(filename):
+        """
+        Read the prompt file, cached until the file is modified.
+        """
+        mtime = os.stat(filename).st_mtime
+        with _lock:
+            cached = _prompts.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
         with open(filename, encoding="UTF-8") as f:
-            return "".join(f.readlines())
+            prompt = f.read()
+        with _lock:
+            _prompts[filename] = (mtime, prompt)
+        return prompt
 
     @staticmethod
     def set_openai_key(key):
@@ -41,34 +94,331 @@ class Openai:
             {"role": "user", "content": content},
         ]  # Set the system prompt
 
-    @staticmethod
-    def get_text_from_response(response):
-        completion_text = ""
-
-        for event in response:
-            if "role" in event["choices"][0]["delta"]:
-                # skip
-                continue
-            if len(event["choices"][0]["delta"]) == 0:
-                # skip
-                continue
-            event_text = event["choices"][0]["delta"]["content"]
-            completion_text += event_text  # append the text
-
-        return completion_text
-
-    def generate_response(self, content):
+    def generate_response(
+        self,
+        content,
+        cache: Optional[DiskCache] = None,
+        attempt: int = 0,
+        bypass_cache: bool = False,
+        stats: Optional[GenerationStats] = None,
+    ):
         logger.info("Getting response...")
-        messages = self.generate_message(content)  # Generate message for chat
+        return "".join(
+            self.stream_response(content, cache, attempt, bypass_cache, stats)
+        )
+
+    def cache_key(self, content, attempt: int = 0) -> str:
+        """
+        Key of a response in the response cache.
+
+        :param content: User message.
+        :param attempt: Number of the retry or candidate, each one is cached separately.
+        """
+        return DiskCache.make_key(
+            "openai",
+            self.model,
+            self.system_prompt,
+            content,
+            {"max_tokens": self.max_tokens},
+            attempt,
+        )
+
+    def get_cached_response(
+        self, content, cache: Optional[DiskCache], attempt: int = 0
+    ) -> Optional[str]:
+        """
+        :return: Cached text of the response or None if it isn't cached.
+        """
+        if cache is None:
+            return None
+        value = cache.get(self.cache_key(content, attempt))
+        return value.decode("utf-8") if value is not None else None
+
+    def stream_response(
+        self,
+        content,
+        cache: Optional[DiskCache] = None,
+        attempt: int = 0,
+        bypass_cache: bool = False,
+        stats: Optional[GenerationStats] = None,
+    ) -> Iterator[str]:
+        """
+        Generate a response and yield its text as it arrives.
+
+        Closing the iterator closes the stream. Time to first token and throughput
+        are logged and written to `stats`. A cached response is yielded as one chunk,
+        only responses streamed to the end are cached.
+
+        :param content: User message.
+        :param cache: Cache of responses, the API is always called if not set.
+        :param attempt: Number of the retry or candidate, each one is cached separately.
+        :param bypass_cache: Don't read the cache, the new response replaces the cached one.
+        :param stats: Filled with the stats of this stream, the generator is shared
+            between threads so stats aren't kept on it.
+        :return: Iterator over text chunks of the response.
+        """
+        if not bypass_cache:
+            cached = self.get_cached_response(content, cache, attempt)
+            if cached is not None:
+                logger.info(f"OpenAI response cache hit, attempt {attempt}")
+                yield cached
+                return
+        chunks = []
+        with closing(self._stream(content, stats or GenerationStats())) as stream:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        if cache is not None:
+            cache.set(self.cache_key(content, attempt), "".join(chunks).encode("utf-8"))
+
+    def _stream(self, content, stats: GenerationStats) -> Iterator[str]:
+        start = time.perf_counter()
+        messages = self.generate_message(content)
+        stats.prompt_tokens = sum(
+            count_tokens(message["content"], self.model) for message in messages
+        )
         response = openai.ChatCompletion.create(
             model=self.model,
             messages=messages,
             stream=True,
-            max_tokens=1500,
+            max_tokens=self.max_tokens,
         )
-        return self.get_text_from_response(response)
+        try:
+            with closing(response):
+                for event in response:
+                    delta = event["choices"][0]["delta"]
+                    if "content" not in delta:
+                        continue
+                    if stats.time_to_first_token is None:
+                        stats.time_to_first_token = time.perf_counter() - start
+                    stats.tokens += 1
+                    yield delta["content"]
+        finally:
+            stats.duration = time.perf_counter() - start
+            logger.info(
+                f"{self.model}: {stats.prompt_tokens} prompt tokens, "
+                f"{stats.tokens} tokens in {stats.duration:.1f}s, "
+                f"first token after {stats.time_to_first_token or 0:.2f}s, "
+                f"{stats.tokens_per_second:.1f} tokens/s"
+            )
+
+
+def get_generator(
+    prompt: str, model: str = "gpt-4", max_tokens: int = MAX_TOKENS
+) -> Openai:
+    """
+    Get the process-wide generator of the prompt.
+
+    Generators are created once. The openai library keeps an HTTP session per thread
+    and renews it every few minutes, it's created with keep-alive connections so they
+    are reused between files and retries.
 
+    :param prompt: File name of the system prompt.
+    :param model: OpenAI model.
+    :param max_tokens: Max tokens of a response.
+    :return: Generator of the prompt.
+    """
+    key = (prompt, model, max_tokens)
+    with _lock:
+        if openai.requestssession is None:
+            # a factory, a shared session would be closed by one thread under the others
+            openai.requestssession = _create_api_session
+        if key not in _generators:
+            _generators[key] = Openai(cfg.OPENAI_API_KEY, prompt, model, max_tokens)
+        return _generators[key]
 
-def run_openai_generation(input_data: str, prompt: str):
-    model = Openai(cfg.OPENAI_API_KEY, prompt)
-    return model.generate_response(input_data)
+
+def _create_api_session():
+    # one request at a time per thread
+    return create_session(pool_size=1)
+
+
+def run_openai_generation(
+    input_data: str,
+    prompt: str,
+    attempt: int = 0,
+    cache: Optional[DiskCache] = None,
+    bypass_cache: bool = False,
+    stats: Optional[GenerationStats] = None,
+):
+    return get_generator(prompt).generate_response(
+        input_data, cache, attempt, bypass_cache, stats
+    )
+
+
+def stream_openai_generation(
+    input_data: str,
+    prompt: str,
+    attempt: int = 0,
+    cache: Optional[DiskCache] = None,
+    bypass_cache: bool = False,
+    stats: Optional[GenerationStats] = None,
+) -> Iterator[str]:
+    """
+    Streaming version of `run_openai_generation`.
+
+    :param stats: Filled with the stats of the stream, left empty for a cached response.
+    :return: Iterator over text chunks of the response.
+    """
+    return get_generator(prompt).stream_response(
+        input_data, cache, attempt, bypass_cache, stats
+    )
+
+
+def run_concurrent_generation(
+    input_data: str,
+    prompt: str,
+    n_candidates: int = 3,
+    min_words: int = 500,
+    cache: Optional[DiskCache] = None,
+    bypass_cache: bool = False,
+    stats: Optional[GenerationStats] = None,
+) -> Tuple[str, int]:
+    """
+    Generate `n_candidates` responses concurrently and return the first good enough one.
+
+    A candidate wins once its complete sections have at least `min_words` words and
+    a valid `###` structure, see `src.utils.is_valid_script`. The winner is generated
+    to the end and the other streams are closed. If no candidate wins, or the winner
+    fails, the longest one is returned. A failed candidate doesn't fail the generation
+    unless no candidate produced any output.
+
+    :param input_data: User message.
+    :param prompt: File name of the system prompt.
+    :param n_candidates: Number of concurrent candidates.
+    :param min_words: Min number of words of a winning candidate.
+    :param cache: Cache of responses, a cached winner is returned without generation.
+    :param bypass_cache: Don't read the cache, new responses replace the cached ones.
+    :param stats: Filled with the stats of the chosen candidate.
+    :return: Text of the chosen candidate and its number.
+    """
+    model = get_generator(prompt)
+    if cache is not None and not bypass_cache:
+        for n_candidate in range(n_candidates):
+            cached = model.get_cached_response(input_data, cache, n_candidate)
+            if cached is not None and is_valid_script(cached, min_words):
+                logger.info(f"OpenAI response cache hit, candidate {n_candidate}")
+                return cached, n_candidate
+    lock = threading.Lock()
+    winner = None
+    errors: Dict[int, Exception] = {}
+    candidate_stats = [GenerationStats() for _ in range(n_candidates)]
+    start = time.perf_counter()
+
+    def try_to_win(n_candidate: int, text: str) -> None:
+        nonlocal winner
+        if winner is None and is_valid_script(text, min_words):
+            with lock:
+                if winner is None:
+                    winner = n_candidate
+                    logger.info(
+                        f"Candidate {n_candidate} won "
+                        f"after {time.perf_counter() - start:.1f}s"
+                    )
+
+    def generate(n_candidate: int) -> str:
+        chunks = []
+        tail = ""
+        try:
+            stream = model.stream_response(
+                input_data,
+                cache,
+                n_candidate,
+                bypass_cache,
+                candidate_stats[n_candidate],
+            )
+            with closing(stream):
+                for chunk in stream:
+                    if winner not in (None, n_candidate):
+                        logger.info(f"Candidate {n_candidate} cancelled")
+                        return "".join(chunks)
+                    chunks.append(chunk)
+                    # a section marker means the previous sections are complete,
+                    # the marker can be split between chunks
+                    window, tail = tail + chunk, (tail + chunk)[-2:]
+                    if winner is None and SECTION_SEP in window:
+                        text = "".join(chunks)
+                        try_to_win(n_candidate, text[: text.rindex(SECTION_SEP)])
+            # the stream has ended, so the last section is complete too
+            try_to_win(n_candidate, "".join(chunks))
+        except Exception as e:
+            logger.warning(f"Candidate {n_candidate} failed: {e}")
+            errors[n_candidate] = e
+        return "".join(chunks)
+
+    with ThreadPoolExecutor(n_candidates, "openai") as pool:
+        outputs = list(pool.map(generate, range(n_candidates)))
+    if errors and not any(outputs):
+        raise next(iter(errors.values()))
+    if winner in errors:
+        logger.warning(f"Candidate {winner} failed after winning")
+        winner = None
+    if winner is None:
+        winner = max(range(n_candidates), key=lambda i: len(outputs[i].split()))
+        logger.info(f"No candidate reached {min_words} words, using candidate {winner}")
+    if stats is not None:
+        for field in fields(GenerationStats):
+            setattr(stats, field.name, getattr(candidate_stats[winner], field.name))
+    return outputs[winner], winner
+
+
+def reduce_input(
+    input_data: str,
+    max_input_tokens: int,
+    chunk_tokens: int,
+    summary_tokens: int = 500,
+    workers: int = 4,
+    cache: Optional[DiskCache] = None,
+    bypass_cache: bool = False,
+    prompt: str = "summarize.txt",
+) -> str:
+    """
+    Shrink an input too long for the script prompt with a map-reduce summary.
+
+    The input is split into chunks of `chunk_tokens` tokens, the chunks are summarized
+    concurrently and the summaries are joined in order. The summaries are reduced
+    the same way until they fit into `max_input_tokens`. Inputs which fit are
+    returned unchanged. Token usage of every stage is logged.
+
+    :param input_data: Reference text of the script.
+    :param max_input_tokens: Max tokens of the input sent to the script prompt.
+    :param chunk_tokens: Max tokens of a summarized chunk.
+    :param summary_tokens: Max tokens of a chunk summary.
+    :param workers: Max concurrent summaries.
+    :param cache: Cache of responses, cached summaries are not generated again.
+    :param bypass_cache: Don't read the cache, new summaries replace the cached ones.
+    :param prompt: File name of the summary system prompt.
+    :return: Input of the script prompt.
+    """
+    model = get_generator(prompt, max_tokens=summary_tokens)
+    tokens = count_tokens(input_data, model.model)
+    logger.info(f"Input: {tokens} tokens")
+    stage = 0
+    while tokens > max_input_tokens:
+        start = time.perf_counter()
+        chunks = split_by_tokens(input_data, chunk_tokens, model.model)
+        with ThreadPoolExecutor(min(workers, len(chunks)), "summarize") as pool:
+            summaries = list(
+                pool.map(
+                    lambda chunk: model.generate_response(
+                        chunk, cache, bypass_cache=bypass_cache
+                    ),
+                    chunks,
+                )
+            )
+        reduced = "\n\n".join(summaries)
+        reduced_tokens = count_tokens(reduced, model.model)
+        prompt_tokens = tokens + len(chunks) * count_tokens(
+            model.system_prompt, model.model
+        )
+        logger.info(
+            f"Summary stage {stage}: {len(chunks)} chunks, "
+            f"{prompt_tokens} prompt tokens, {reduced_tokens} completion tokens "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        if reduced_tokens >= tokens:
+            logger.warning(f"Summaries don't shrink the input, using {tokens} tokens")
+            break
+        input_data, tokens = reduced, reduced_tokens
+        stage += 1
+    return input_data
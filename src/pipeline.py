@@ -0,0 +1,103 @@
+import threading
+from dataclasses import dataclass
+from queue import Queue
+from typing import Any, Callable, Iterable, List
+
+from src.logger import logger
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+    retries: int = 0
+
+
+class Pipeline:
+    """
+    Run items through a chain of stages, each stage with its own pool of worker
+    threads. Stages are connected by bounded queues, so while one item is processed
+    by a slow stage the following items are already handled by the earlier ones.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 1):
+        """
+        :param stages: Ordered list of stages. The output of a stage is the input of the next one.
+        :param queue_size: Maximum number of items waiting between two stages.
+        """
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items: Iterable) -> list:
+        """
+        Push all `items` through the pipeline and wait until every item is done.
+
+        Items which failed in some stage (after its retries) are logged and dropped,
+        the rest of the items keep flowing.
+
+        :param items: Input items of the first stage.
+        :return: Outputs of the last stage, in order of completion.
+        """
+        queues = [Queue(maxsize=self.queue_size) for _ in self.stages]
+        results: Queue = Queue()
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]))]
+        for n, stage in enumerate(self.stages):
+            out_queue = queues[n + 1] if n + 1 < len(self.stages) else results
+            n_next = self.stages[n + 1].workers if n + 1 < len(self.stages) else 0
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(stage, queues[n], out_queue, n_next, remaining, lock),
+                        name=f"{stage.name}-worker",
+                    )
+                )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [results.get() for _ in range(results.qsize())]
+
+    def _feed(self, items: Iterable, queue: Queue) -> None:
+        for item in items:
+            queue.put(item)
+        for _ in range(self.stages[0].workers):
+            queue.put(_STOP)
+
+    @staticmethod
+    def _work(
+        stage: Stage,
+        in_queue: Queue,
+        out_queue: Queue,
+        n_next: int,
+        remaining: list,
+        lock: threading.Lock,
+    ) -> None:
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            for attempt in range(stage.retries + 1):
+                try:
+                    result = stage.func(item)
+                except Exception as e:
+                    logger.error(
+                        f"Stage {stage.name} failed on {item} "
+                        f"(attempt {attempt + 1}/{stage.retries + 1}): {e!r}"
+                    )
+                else:
+                    out_queue.put(result)
+                    break
+        # the last worker of the stage closes the next one
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                for _ in range(n_next):
+                    out_queue.put(_STOP)
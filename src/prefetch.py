@@ -0,0 +1,107 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from requests import Session
+
+from src.audio import get_tts_engine
+from src.cache import DiskCache
+from src.logger import logger
+from src.utils import Elem
+from src.video_processing import get_storyblocks_video_urls
+from src.yt_download import _search_yt_videos
+
+# results requested by the prefetch search, the footage stage asks for the same page
+# for every paragraph shorter than 55 seconds
+PREFETCH_RESULTS = 10
+
+
+class ScriptPrefetcher:
+    """
+    Warm the caches with the work of a script while the script is still being generated.
+
+    Footage searches of every "query" section fill the search cache, sentences of every
+    "text" section fill the TTS cache, so the voice-over and footage stages find most
+    of their work done. Nothing is prefetched into a cache which is not set.
+    Failures are logged and left to the later stages.
+    """
+
+    def __init__(
+        self,
+        cookies: dict,
+        yt_proba: int,
+        session: Optional[Session] = None,
+        search_cache: Optional[DiskCache] = None,
+        tts_cache: Optional[DiskCache] = None,
+        workers: int = 2,
+    ):
+        """
+        :param cookies: Cookies required for Storyblocks authentication.
+        :param yt_proba: Probability to use YouTube as a video source in percent.
+        :param session: Pooled HTTP session for Storyblocks requests.
+        :param search_cache: Cache of Storyblocks and YouTube search results.
+        :param tts_cache: Cache of sentence waveforms.
+        :param workers: Max concurrent footage searches.
+        """
+        self.cookies = cookies
+        self.yt_proba = yt_proba
+        self.session = session
+        self.search_cache = search_cache
+        self.tts_cache = tts_cache
+        self._search_pool = ThreadPoolExecutor(workers, "prefetch-search")
+        # the TTS engine synthesizes one paragraph at a time anyway
+        self._tts_pool = ThreadPoolExecutor(1, "prefetch-tts")
+        self.futures: List[Future] = []
+
+    def add(self, elem: Elem) -> Optional[Future]:
+        """
+        Start prefetching a parsed section of the script.
+
+        :param elem: Section of the script, see `src.utils.ScriptParser`.
+        :return: Future of the prefetch, None if there is nothing to prefetch.
+        """
+        if elem.type == "query" and self.search_cache is not None:
+            future = self._search_pool.submit(self._search, elem.text)
+        elif elem.type == "text" and self.tts_cache is not None:
+            future = self._tts_pool.submit(self._synthesize, elem.text)
+        else:
+            return None
+        self.futures.append(future)
+        return future
+
+    def close(self) -> None:
+        """
+        Let the started prefetches finish in the background.
+        """
+        for pool in (self._search_pool, self._tts_pool):
+            pool.shutdown(wait=False)
+
+    def cancel(self) -> None:
+        """
+        Drop the prefetches of a discarded script, only the running ones are finished.
+        """
+        for pool in (self._search_pool, self._tts_pool):
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _search(self, query: str) -> None:
+        try:
+            if self.yt_proba < 100:
+                get_storyblocks_video_urls(
+                    query.split(),
+                    PREFETCH_RESULTS,
+                    self.cookies,
+                    self.session,
+                    self.search_cache,
+                )
+            if self.yt_proba > 0:
+                _search_yt_videos(query, self.search_cache)
+        except Exception as e:
+            logger.warning(f"Search prefetch failed for {query}: {e}")
+
+    def _synthesize(self, text: str) -> None:
+        import nltk
+
+        try:
+            # the waveforms land in the engine cache
+            list(get_tts_engine(self.tts_cache).synthesize(nltk.sent_tokenize(text)))
+        except Exception as e:
+            logger.warning(f"TTS prefetch failed: {e}")
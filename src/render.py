@@ -0,0 +1,137 @@
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from pathlib import Path
+from typing import List, Optional, Union
+
+from src.config import ENCODE_PROFILES, EncodeProfile
+from src.ffmpeg_utils import run_ffmpeg, write_concat_list
+from src.logger import logger
+from src.timeline import TimelineClip
+
+
+def render_video(
+    timeline: List[TimelineClip],
+    audio_path: str,
+    output_path: Union[str, Path],
+    profile: EncodeProfile = ENCODE_PROFILES["final"],
+    workers: int = 1,
+) -> None:
+    """
+    Render the timeline with the voice-over in a single ffmpeg run.
+
+    Clips are decoded once, scaled and resampled only if they don't match the output
+    and joined by one filter graph, so the video is encoded exactly once.
+    With `workers` > 1 every paragraph is encoded separately and in parallel, and the
+    segments are joined without re-encoding.
+
+    :param timeline: Clips to render, see `src.timeline.build_timeline`.
+    :param audio_path: Path to the voice-over audio.
+    :param output_path: Path of the rendered video.
+    :param profile: Encoding settings, clips are letterboxed to the profile size.
+    :param workers: Number of paragraphs encoded in parallel.
+    """
+    logger.info(f"Rendering {len(timeline)} clips to {output_path}")
+    if workers > 1:
+        _render_segments(timeline, audio_path, output_path, profile, workers)
+    else:
+        run_ffmpeg(build_render_args(timeline, audio_path, output_path, profile))
+    logger.info(f"Video saved OK {output_path}")
+
+
+def _render_segments(
+    timeline: List[TimelineClip],
+    audio_path: str,
+    output_path: Union[str, Path],
+    profile: EncodeProfile,
+    workers: int,
+) -> None:
+    segments = [
+        list(clips) for _, clips in groupby(timeline, key=lambda c: c.paragraph)
+    ]
+    with tempfile.TemporaryDirectory(dir=Path(output_path).parent) as tmp_dir:
+        jobs = []
+        end_frame = 0
+        for n_segment, segment in enumerate(segments):
+            # frame counts come from the timeline position, so rounding doesn't drift
+            start_frame, end_frame = end_frame, round(segment[-1].end * profile.fps)
+            segment_path = f"{tmp_dir}/{n_segment}.mkv"
+            jobs.append(
+                build_render_args(
+                    segment, None, segment_path, profile, end_frame - start_frame
+                )
+            )
+        with ThreadPoolExecutor(workers, "render") as pool:
+            list(pool.map(run_ffmpeg, jobs))
+
+        list_path = f"{tmp_dir}/segments.txt"
+        write_concat_list([job[-1] for job in jobs], list_path)
+        args = ["-f", "concat", "-safe", "0", "-i", list_path, "-i", audio_path]
+        args += ["-map", "0:v", "-map", "1:a", "-c:v", "copy"]
+        args += ["-c:a", profile.audio_codec]
+        args += ["-movflags", "+faststart", output_path]
+        run_ffmpeg(args)
+
+
+def render_preview(
+    timeline: List[TimelineClip],
+    audio_path: str,
+    output_path: Union[str, Path],
+    profile: EncodeProfile = ENCODE_PROFILES["preview"],
+) -> None:
+    """
+    Render a low resolution, low frame rate preview of the timeline for a quick review.
+
+    The preview uses the same timeline as the final render, see `render_video`.
+    """
+    render_video(timeline, audio_path, output_path, profile)
+
+
+def build_render_args(
+    timeline: List[TimelineClip],
+    audio_path: Optional[str],
+    output_path: Union[str, Path],
+    profile: EncodeProfile = ENCODE_PROFILES["final"],
+    frames: Optional[int] = None,
+) -> List[str]:
+    """
+    Build ffmpeg arguments rendering the timeline, see `render_video`.
+
+    :param audio_path: Path to the voice-over audio, the video has no audio if None.
+    :param frames: Exact number of output frames, not limited if None.
+    :return: ffmpeg arguments, without the binary itself.
+    """
+    args = []
+    for clip in timeline:
+        # input duration limit stops reading the clip right after the used part
+        args += ["-t", f"{clip.duration:.3f}", "-i", clip.path]
+    if audio_path is not None:
+        args += ["-i", audio_path]
+
+    filters = []
+    for i, clip in enumerate(timeline):
+        filters.append(f"[{i}:v]{_normalize_filter(clip, profile)}[v{i}]")
+    inputs = "".join(f"[v{i}]" for i in range(len(timeline)))
+    filters.append(f"{inputs}concat=n={len(timeline)}:v=1:a=0[v]")
+
+    args += ["-filter_complex", ";".join(filters)]
+    args += ["-map", "[v]"]
+    args += [*profile.video_args(), "-r", profile.fps]
+    if frames is not None:
+        args += ["-frames:v", frames]
+    if audio_path is not None:
+        args += ["-map", f"{len(timeline)}:a", "-c:a", profile.audio_codec]
+    args += ["-movflags", "+faststart", output_path]
+    return args
+
+
+def _normalize_filter(clip: TimelineClip, profile: EncodeProfile) -> str:
+    filters = []
+    if clip.video_size is None or tuple(clip.video_size) != profile.size:
+        filters.append(profile.scale_filter())
+    filters.append("setsar=1")
+    if clip.video_fps is None or abs(clip.video_fps - profile.fps) > 0.01:
+        filters.append(f"fps={profile.fps}")
+    if clip.hold > 0:
+        filters.append(f"tpad=stop_mode=clone:stop_duration={clip.hold:.3f}")
+    return ",".join(filters)
@@ -1,31 +1,39 @@
+import subprocess
+import sys
 from unittest.mock import patch
 
-from src.audio import generate_voice_over
-from src.utils import Elem
+import numpy as np
+import pytest
+import soundfile as sf
+
+import src.audio
+from src.audio import generate_voice_over, get_tts_engine, write_audio_stream
+from src.utils import Elem, load_timings
+
+
+@pytest.fixture(autouse=True)
+def reset_engine():
+    src.audio._engine = None
+    yield
+    src.audio._engine = None
 
 
 class TestGenerateVoiceOver:
-    @patch("src.audio.preload_models")
-    @patch("src.audio.generate_text_semantic")
-    @patch("src.audio.semantic_to_waveform")
-    @patch("src.audio.sf.write")
-    @patch("src.audio.sf.SoundFile")
+    @patch("src.bark_engine.preload_models")
+    @patch("src.bark_engine.generate_text_semantic")
+    @patch("src.bark_engine.semantic_to_waveform")
     @patch("nltk.sent_tokenize")
     def test_generate_voice_over(
         self,
         mock_sent_tokenize,
-        mock_soundfile,
-        mock_sf_write,
         mock_semantic_to_waveform,
         mock_generate_text_semantic,
         mock_preload_models,
+        tmp_path,
     ):
         # Prepare mock behavior for the external dependencies
         mock_sent_tokenize.return_value = ["This is a sentence.", "Another sentence."]
-        mock_soundfile_instance = mock_soundfile.return_value
-        mock_soundfile_instance.frames = 1000
-        mock_soundfile_instance.samplerate = 24000
-        mock_semantic_to_waveform.return_value = [0.1, 0.1, 0.1]
+        mock_semantic_to_waveform.return_value = np.full(1000, 0.1)
         mock_generate_text_semantic.return_value = [
             "semantic_token_1",
             "semantic_token_2",
@@ -34,7 +42,7 @@ class TestGenerateVoiceOver:
         # Run the function
         output_duration = generate_voice_over(
             [Elem("text", "Another sentence.")],
-            "output_dir",
+            str(tmp_path),
         )
 
         # Assertions
@@ -50,5 +58,82 @@ class TestGenerateVoiceOver:
             ["semantic_token_1", "semantic_token_2"],
             history_prompt="v2/en_speaker_2",
         )
-        mock_sf_write.assert_called_once()
-        assert output_duration == 1000 / 24000
+        # two sentences, each followed by a quarter second of silence
+        assert output_duration == (2 * 1000 + 2 * 6000) / 24000
+        assert sf.info(str(tmp_path / "voiceover.wav")).frames == 2 * 1000 + 2 * 6000
+
+    def test_write_audio_stream(self, tmp_path):
+        file_path = str(tmp_path / "voiceover.wav")
+
+        duration, offsets = write_audio_stream(
+            iter([np.full(100, 0.5), np.full(300, -0.5)]), file_path
+        )
+
+        assert offsets == [(0, 100), (6100, 6400)]
+        assert duration == 12400 / 24000
+        audio, sample_rate = sf.read(file_path)
+        assert sample_rate == 24000
+        assert len(audio) == 12400
+        assert audio[50] > 0.4 and audio[6200] < -0.4
+        assert not audio[100:6100].any()
+
+    @patch("src.bark_engine.preload_models")
+    @patch("src.bark_engine.generate_text_semantic")
+    @patch("src.bark_engine.semantic_to_waveform")
+    @patch(
+        "nltk.sent_tokenize",
+        side_effect=lambda text: [
+            f"{s.strip()}." for s in text.split(".") if s.strip()
+        ],
+    )
+    def test_generate_voice_over_saves_timings(
+        self,
+        mock_sent_tokenize,
+        mock_semantic_to_waveform,
+        mock_generate_text_semantic,
+        mock_preload_models,
+        tmp_path,
+    ):
+        mock_semantic_to_waveform.side_effect = [np.zeros(n) for n in (100, 200, 300)]
+
+        generate_voice_over(
+            [
+                Elem("title", "Title"),
+                Elem("text", "First one. Second one."),
+                Elem("query", "query"),
+                Elem("text", "Third one."),
+            ],
+            str(tmp_path),
+        )
+
+        timings = load_timings(tmp_path / "voiceover.wav")
+        assert timings["sample_rate"] == 24000
+        assert timings["samples"] == 600 + 3 * 6000
+        first, second = timings["paragraphs"]
+        assert [s["text"] for s in first["sentences"]] == ["First one.", "Second one."]
+        assert (first["start"], first["end"]) == (0, 12300)
+        assert (first["sentences"][1]["start"], first["sentences"][1]["end"]) == (
+            6100,
+            6300,
+        )
+        assert (second["start"], second["end"]) == (12300, 18600)
+        assert second["sentences"] == [
+            {"text": "Third one.", "start": 12300, "end": 12600}
+        ]
+
+
+class TestTTSEngine:
+    @patch("src.bark_engine.preload_models")
+    def test_engine_is_loaded_once(self, mock_preload_models):
+        engine = get_tts_engine()
+
+        assert get_tts_engine() is engine
+        mock_preload_models.assert_called_once()
+
+    def test_import_does_not_load_bark(self):
+        code = "import sys, src.audio; print('bark' in sys.modules, 'torch' in sys.modules)"
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+
+        assert output.split() == ["False", "False"]
@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from bark.generation import SEMANTIC_PAD_TOKEN, SEMANTIC_VOCAB_SIZE
+
+from src.bark_engine import BarkEngine, generate_text_semantic_batch
+from src.cache import DiskCache
+
+
+class FakeSemanticModel(torch.nn.Module):
+    """Emits token 7 until the row reached its length, then the end token."""
+
+    def __init__(self, stop_after):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+        self.stop_after = stop_after
+
+    def forward(self, x, merge_context=False, use_cache=False, past_kv=None):
+        step = 0 if past_kv is None else past_kv + 1
+        logits = torch.full((x.shape[0], 1, SEMANTIC_VOCAB_SIZE + 1), -1e9)
+        for row, stop_after in enumerate(self.stop_after):
+            token = SEMANTIC_PAD_TOKEN if step >= stop_after else 7
+            logits[row, 0, token] = 0.0
+        return logits, step
+
+
+class TestBatchedSynthesis:
+    @patch(
+        "src.bark_engine.generation._tokenize", side_effect=lambda _, t: [1] * len(t)
+    )
+    def test_generate_text_semantic_batch(self, mock_tokenize):
+        model = FakeSemanticModel([3, 1, 5])
+        with patch.dict(
+            "src.bark_engine.generation.models",
+            {"text": {"model": model, "tokenizer": None}},
+        ):
+            result = generate_text_semantic_batch(["a", "bb", "ccc"])
+
+        assert [list(tokens) for tokens in result] == [[7] * 3, [7], [7] * 5]
+
+    @patch(
+        "src.bark_engine.generation._tokenize", side_effect=lambda _, t: [1] * len(t)
+    )
+    def test_generate_text_semantic_batch_pads_finished_rows(self, mock_tokenize):
+        class ResumingModel(FakeSemanticModel):
+            # a finished row samples regular tokens again after its end token
+            def forward(self, x, merge_context=False, use_cache=False, past_kv=None):
+                self.inputs.append(x[:, -1].tolist())
+                logits, step = super().forward(x, merge_context, use_cache, past_kv)
+                if step > self.stop_after[0]:
+                    logits[0, 0, :] = -1e9
+                    logits[0, 0, 7] = 0.0
+                return logits, step
+
+        model = ResumingModel([1, 4])
+        model.inputs = []
+        with patch.dict(
+            "src.bark_engine.generation.models",
+            {"text": {"model": model, "tokenizer": None}},
+        ):
+            result = generate_text_semantic_batch(["a", "bb"])
+
+        assert [list(tokens) for tokens in result] == [[7], [7] * 4]
+        assert [tokens[0] for tokens in model.inputs[2:]] == [SEMANTIC_PAD_TOKEN] * 3
+
+    @patch("src.bark_engine.generate_text_semantic_batch")
+    @patch(
+        "src.bark_engine.semantic_to_waveform", side_effect=lambda tokens, **_: tokens
+    )
+    @patch(
+        "src.bark_engine.generation._tokenize", side_effect=lambda _, t: [1] * len(t)
+    )
+    def test_synthesize_batches_keep_order(
+        self, mock_tokenize, mock_semantic_to_waveform, mock_batch
+    ):
+        mock_batch.side_effect = lambda texts, **_: texts
+        sentences = ["ccc", "a", "dddd", "bb", "e"]
+        engine = BarkEngine(batch_size=2)
+        with patch.dict(
+            "src.bark_engine.generation.models", {"text": {"tokenizer": None}}
+        ):
+            result = list(engine.synthesize(sentences))
+
+        assert result == sentences
+        # sentences of similar length are batched together
+        assert [call.args[0] for call in mock_batch.call_args_list] == [
+            ["a", "e"],
+            ["bb", "ccc"],
+            ["dddd"],
+        ]
+
+    @patch("src.bark_engine.generate_text_semantic", side_effect=lambda text, **_: text)
+    @patch(
+        "src.bark_engine.semantic_to_waveform",
+        side_effect=lambda text, **_: np.full(3, len(text), dtype=np.float32),
+    )
+    def test_synthesize_reuses_cached_sentences(
+        self, mock_semantic_to_waveform, mock_generate_text_semantic
+    ):
+        engine = BarkEngine(cache=DiskCache(":memory:"))
+        list(engine.synthesize(["One.", "Two  words."]))
+        mock_generate_text_semantic.reset_mock()
+
+        result = list(engine.synthesize(["Two words.", "One.", "Three."]))
+
+        mock_generate_text_semantic.assert_called_once()
+        assert mock_generate_text_semantic.call_args.args[0] == "Three."
+        assert [list(audio) for audio in result] == [[11] * 3, [4] * 3, [6] * 3]
+
+    @patch("src.bark_engine.generate_text_semantic", side_effect=lambda text, **_: text)
+    @patch(
+        "src.bark_engine.semantic_to_waveform",
+        side_effect=lambda text, **_: np.full(3, len(text), dtype=np.float32),
+    )
+    def test_synthesize_loads_cached_sentences_lazily(
+        self, mock_semantic_to_waveform, mock_generate_text_semantic
+    ):
+        engine = BarkEngine(cache=DiskCache(":memory:"))
+        list(engine.synthesize(["One.", "Two.", "Three."]))
+
+        with patch("src.bark_engine.np.load", wraps=np.load) as mock_load:
+            audio = engine.synthesize(["One.", "Two.", "Three."])
+            assert list(next(audio)) == [4] * 3
+            assert mock_load.call_count == 1
+            assert len(list(audio)) == 2
+            assert mock_load.call_count == 3
+
+    @patch("src.bark_engine.generate_text_semantic", side_effect=lambda text, **_: text)
+    @patch(
+        "src.bark_engine.semantic_to_waveform",
+        side_effect=lambda text, **_: np.full(3, len(text), dtype=np.float32),
+    )
+    def test_synthesize_regenerates_evicted_sentences(
+        self, mock_semantic_to_waveform, mock_generate_text_semantic
+    ):
+        engine = BarkEngine(cache=DiskCache(":memory:"))
+        list(engine.synthesize(["One."]))
+
+        with patch.object(engine.cache, "get", return_value=None):
+            result = list(engine.synthesize(["One."]))
+
+        assert [list(audio) for audio in result] == [[4] * 3]
+        assert mock_generate_text_semantic.call_count == 2
+
+    @patch("src.bark_engine.preload_models")
+    @patch("src.bark_engine.generate_text_semantic", side_effect=lambda text, **_: text)
+    @patch(
+        "src.bark_engine.semantic_to_waveform",
+        side_effect=lambda text, **_: np.full(2, len(text), dtype=np.float32),
+    )
+    @patch(
+        "src.bark_engine.ProcessPoolExecutor",
+        side_effect=lambda workers, mp_context, initializer, initargs: ThreadPoolExecutor(
+            workers, initializer=initializer, initargs=initargs
+        ),
+    )
+    def test_synthesize_with_workers_keeps_order(
+        self,
+        mock_pool,
+        mock_semantic_to_waveform,
+        mock_generate_text_semantic,
+        mock_preload_models,
+    ):
+        engine = BarkEngine(workers=3, threads=1)
+        engine.load()
+        sentences = ["a" * n for n in range(1, 8)]
+
+        result = list(engine.synthesize(sentences))
+        engine.close()
+
+        assert mock_pool.call_args.args[0] == 3
+        assert [audio[0] for audio in result] == list(range(1, 8))
+        assert mock_generate_text_semantic.call_count == 7
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from src.cache import DiskCache
+
+
+class TestDiskCache:
+    def test_get_set(self, tmpdir):
+        cache = DiskCache(str(tmpdir.join("cache.sqlite")))
+        assert cache.get("key") is None
+        cache.set("key", b"value")
+        assert cache.get("key") == b"value"
+        cache.set_json("json", {"a": [1, 2]})
+        assert cache.get_json("json") == {"a": [1, 2]}
+
+    def test_persistent(self, tmpdir):
+        path = str(tmpdir.join("cache.sqlite"))
+        DiskCache(path).set("key", b"value")
+        assert DiskCache(path).get("key") == b"value"
+
+    def test_ttl(self):
+        cache = DiskCache(":memory:", ttl=10)
+        with patch("src.cache.time.time", return_value=100):
+            cache.set("key", b"value")
+        with patch("src.cache.time.time", return_value=105):
+            assert cache.contains("key")
+            assert cache.get("key") == b"value"
+        with patch("src.cache.time.time", return_value=111):
+            assert not cache.contains("key")
+        with patch("src.cache.time.time", return_value=111):
+            assert cache.get("key") is None
+
+    def test_size_eviction(self):
+        cache = DiskCache(":memory:", max_bytes=10)
+        with patch("src.cache.time.time", return_value=1):
+            cache.set("a", b"1234")
+        with patch("src.cache.time.time", return_value=2):
+            cache.set("b", b"1234")
+        with patch("src.cache.time.time", return_value=3):
+            # "a" becomes the most recently used one
+            cache.get("a")
+        with patch("src.cache.time.time", return_value=4):
+            cache.set("c", b"1234")
+        assert cache.get("b") is None
+        assert cache.get("a") == b"1234"
+        assert cache.get("c") == b"1234"
+
+    def test_make_key(self):
+        assert DiskCache.make_key("a", {"x": 1, "y": 2}) == DiskCache.make_key(
+            "a", {"y": 2, "x": 1}
+        )
+        assert DiskCache.make_key("a") != DiskCache.make_key("b")
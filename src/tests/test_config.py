@@ -1,6 +1,8 @@
 from unittest.mock import patch
 
-from src.config import Config, get_config
+import pytest
+
+from src.config import Config, EncodeProfile, get_config
 
 conf_dict = {
     "OPENAI_API_KEY": "your_key",
@@ -29,3 +31,25 @@ class TestConfigFunctions:
             OUTPUT_DIR="output",
             YT_PROBA=80,
         )
+
+    def test_get_encode_profile(self):
+        config = Config(**conf_dict, ENCODE_PROFILES={"final": {"crf": 18}})
+
+        assert config.get_encode_profile() == EncodeProfile(crf=18)
+        assert config.get_encode_profile("shorts").size == (1080, 1920)
+
+    def test_get_encode_profile_custom(self):
+        config = Config(
+            **conf_dict,
+            ENCODE_PROFILE="square",
+            ENCODE_PROFILES={"square": {"width": 1080, "height": 1080}},
+        )
+
+        profile = config.get_encode_profile()
+
+        assert profile.size == (1080, 1080)
+        assert profile.video_args()[:2] == ["-c:v", "libx264"]
+
+    def test_get_encode_profile_unknown(self):
+        with pytest.raises(ValueError):
+            Config(**conf_dict).get_encode_profile("unknown")
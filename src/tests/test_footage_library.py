@@ -0,0 +1,110 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from src import footage_library
+from src.footage_library import FootageLibrary
+
+
+def write_file(path, content: bytes):
+    def download(p):
+        with open(p, "wb") as f:
+            f.write(content)
+
+    download(path)
+    return download
+
+
+class TestFootageLibrary:
+    def test_fetch_downloads_once(self, tmpdir):
+        library = FootageLibrary(str(tmpdir.join("library")))
+        download = Mock(side_effect=lambda p: write_file(p, b"clip"))
+
+        library.fetch("storyblocks:url", str(tmpdir.join("0_0.mp4")), download)
+        library.fetch("storyblocks:url", str(tmpdir.join("1_0.mp4")), download)
+
+        assert download.call_count == 1
+        assert tmpdir.join("0_0.mp4").read_binary() == b"clip"
+        assert tmpdir.join("1_0.mp4").read_binary() == b"clip"
+
+    def test_concurrent_fetch_downloads_once(self, tmpdir):
+        library = FootageLibrary(str(tmpdir.join("library")))
+
+        def slow_download(p):
+            time.sleep(0.05)
+            write_file(p, b"clip")
+
+        download = Mock(side_effect=slow_download)
+        paths = [str(tmpdir.join(f"{i}_0.mp4")) for i in range(4)]
+        with ThreadPoolExecutor(4) as pool:
+            list(
+                pool.map(lambda p: library.fetch("storyblocks:url", p, download), paths)
+            )
+
+        assert download.call_count == 1
+        assert all(open(p, "rb").read() == b"clip" for p in paths)
+
+    def test_concurrent_add_of_same_content(self, tmpdir):
+        link_or_copy = footage_library._link_or_copy
+
+        def slow_link_or_copy(src, dst):
+            link_or_copy(src, dst)
+            # widen the window between linking the temp file and moving it
+            time.sleep(0.02)
+
+        library = FootageLibrary(str(tmpdir.join("library")))
+        paths = [str(tmpdir.join(f"{i}.mp4")) for i in range(8)]
+        for path in paths:
+            write_file(path, b"clip")
+        barrier = threading.Barrier(len(paths))
+
+        def add(n):
+            barrier.wait(5)
+            return library.add(f"source:{n}", paths[n])
+
+        with patch("src.footage_library._link_or_copy", slow_link_or_copy):
+            with ThreadPoolExecutor(len(paths)) as pool:
+                stored = set(pool.map(add, range(len(paths))))
+
+        assert len(stored) == 1
+        assert stored.pop().read_bytes() == b"clip"
+        objects = tmpdir.join("library", "objects")
+        assert not [p for p in objects.visit() if p.basename.endswith(".tmp")]
+
+    def test_same_content_stored_once(self, tmpdir):
+        library = FootageLibrary(str(tmpdir.join("library")))
+        write_file(str(tmpdir.join("a.mp4")), b"clip")
+        write_file(str(tmpdir.join("b.mp4")), b"clip")
+
+        path_a = library.add("youtube:a", str(tmpdir.join("a.mp4")))
+        path_b = library.add("youtube:b", str(tmpdir.join("b.mp4")))
+
+        assert path_a == path_b
+        assert library.lookup("youtube:a") == library.lookup("youtube:b") == path_a
+
+    def test_lookup_survives_source_removal(self, tmpdir):
+        library = FootageLibrary(str(tmpdir.join("library")))
+        write_file(str(tmpdir.join("a.mp4")), b"clip")
+        library.add("youtube:a", str(tmpdir.join("a.mp4")))
+        os.remove(tmpdir.join("a.mp4"))
+
+        assert library.lookup("youtube:a").read_bytes() == b"clip"
+        assert library.lookup("youtube:missing") is None
+
+    @patch("src.footage_library.time.time", side_effect=itertools.count())
+    def test_lru_eviction(self, mock_time, tmpdir):
+        library = FootageLibrary(str(tmpdir.join("library")), max_bytes=8)
+        for name in ("a", "b"):
+            write_file(str(tmpdir.join(f"{name}.mp4")), name.encode() * 4)
+            library.add(f"youtube:{name}", str(tmpdir.join(f"{name}.mp4")))
+        # touch "a" so "b" is the least recently used
+        library.lookup("youtube:a")
+        write_file(str(tmpdir.join("c.mp4")), b"cccc")
+        library.add("youtube:c", str(tmpdir.join("c.mp4")))
+
+        assert library.lookup("youtube:b") is None
+        assert library.lookup("youtube:a") is not None
+        assert library.lookup("youtube:c") is not None
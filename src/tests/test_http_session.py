@@ -0,0 +1,24 @@
+from unittest.mock import MagicMock
+
+from src.http_session import create_session, get_connection_stats
+
+
+class TestHttpSession:
+    def test_create_session(self):
+        session = create_session({"cookie_name": "cookie_value"}, pool_size=4)
+        adapter = session.get_adapter("https://www.storyblocks.com")
+        assert session.cookies["cookie_name"] == "cookie_value"
+        assert adapter is session.get_adapter("http://www.storyblocks.com")
+        assert adapter._pool_maxsize == 4
+        assert 429 in adapter.max_retries.status_forcelist
+
+    def test_get_connection_stats(self):
+        session = create_session()
+        adapter = session.get_adapter("https://www.storyblocks.com")
+        pool = MagicMock(num_requests=5, num_connections=2)
+        adapter.poolmanager.pools["key"] = pool
+        assert get_connection_stats(session) == {
+            "requests": 5,
+            "opened": 2,
+            "reused": 3,
+        }
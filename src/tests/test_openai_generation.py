@@ -0,0 +1,324 @@
+import os
+import threading
+from contextlib import closing
+from unittest.mock import patch
+
+import openai
+import pytest
+
+from src.cache import DiskCache
+from src.openai_generation import (
+    GenerationStats,
+    Openai,
+    get_generator,
+    reduce_input,
+    run_concurrent_generation,
+    run_openai_generation,
+    stream_openai_generation,
+)
+from src.tokens import count_tokens
+from src.utils import is_valid_script
+
+SCRIPT = "###TITLE: Title ###TEXT: one two three four ###QUERY: query ###DESCRIPTION: d"
+
+
+def stream(chunks, closed=None, gate=None):
+    try:
+        for chunk in chunks:
+            if gate is not None:
+                gate.wait(5)
+            yield chunk
+    finally:
+        if closed is not None:
+            closed.set()
+
+
+class TestConcurrentGeneration:
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_first_valid_candidate_wins(self, mock_stream_response, _):
+        closed = [threading.Event() for _ in range(3)]
+        gate = threading.Event()
+        # candidate 0 is valid, the others are blocked until it wins
+        streams = [
+            stream([c + " " for c in SCRIPT.split(" ")] + ["###END"], closed[0]),
+            stream(["###TITLE: slow", " ###TEXT: a", " b"], closed[1], gate),
+            stream(["###TITLE: slow", " ###TEXT: a", " b"], closed[2], gate),
+        ]
+        mock_stream_response.side_effect = streams
+
+        def release():
+            closed[0].wait(5)
+            gate.set()
+
+        threading.Thread(target=release).start()
+        text, winner = run_concurrent_generation("input", "prompt.txt", 3, 4)
+
+        assert winner == 0
+        assert text.startswith("###TITLE: Title") and text.endswith("###END")
+        assert all(event.is_set() for event in closed)
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_longest_candidate_without_winner(self, mock_stream_response, _):
+        mock_stream_response.side_effect = [
+            stream(["###TITLE: a ###TEXT: b"]),
+            stream(["###TITLE: a ###TEXT: b c d"]),
+        ]
+
+        text, winner = run_concurrent_generation("input", "prompt.txt", 2, 500)
+
+        assert (text, winner) == ("###TITLE: a ###TEXT: b c d", 1)
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_separator_split_between_chunks(self, mock_stream_response, _):
+        mock_stream_response.side_effect = [
+            stream(["###TITLE: t ###TEXT: a ###QUERY: q w w #", "##END"]),
+        ]
+        with patch(
+            "src.openai_generation.is_valid_script", wraps=is_valid_script
+        ) as mock_is_valid_script:
+            run_concurrent_generation("input", "prompt.txt", 1, 5)
+
+        checked = [c.args[0] for c in mock_is_valid_script.call_args_list]
+        # the query section is checked once the split marker completes it
+        assert "###TITLE: t ###TEXT: a ###QUERY: q w w " in checked
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_incomplete_section_doesnt_win(self, mock_stream_response, _):
+        mock_stream_response.side_effect = [
+            # "###QUERY" is still being generated when the words are counted
+            stream(["###TITLE: t ###TEXT: a ###QU", "ERY: q w w w w w", " ###END"]),
+        ]
+        with patch(
+            "src.openai_generation.is_valid_script", wraps=is_valid_script
+        ) as mock_is_valid_script:
+            run_concurrent_generation("input", "prompt.txt", 1, 5)
+
+        checked = [c.args[0] for c in mock_is_valid_script.call_args_list]
+        assert all(not text.endswith("###QU") for text in checked)
+        assert "###TITLE: t ###TEXT: a ###QUERY: q w w w w w " in checked
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_failed_candidate_doesnt_fail_generation(self, mock_stream_response, _):
+        def failing_stream():
+            yield "###TITLE: a"
+            raise ConnectionError("stream reset")
+
+        mock_stream_response.side_effect = [failing_stream(), stream([SCRIPT])]
+
+        text, winner = run_concurrent_generation("input", "prompt.txt", 2, 4)
+
+        assert (text, winner) == (SCRIPT, 1)
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_all_candidates_failed(self, mock_stream_response, _):
+        mock_stream_response.side_effect = ConnectionError("offline")
+
+        with pytest.raises(ConnectionError):
+            run_concurrent_generation("input", "prompt.txt", 2, 4)
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_winner_stats(self, mock_stream_response, _):
+        def fake_stream(input_data, cache, n_candidate, bypass_cache, stats):
+            stats.tokens = n_candidate + 1
+            return stream(["###TITLE: a ###TEXT: b" + " c" * n_candidate])
+
+        mock_stream_response.side_effect = fake_stream
+        stats = GenerationStats()
+
+        _, winner = run_concurrent_generation(
+            "input", "prompt.txt", 2, 500, stats=stats
+        )
+
+        assert winner == 1
+        assert stats.tokens == 2
+
+
+def events(*texts):
+    yield {"choices": [{"delta": {"role": "assistant"}}]}
+    for text in texts:
+        yield {"choices": [{"delta": {"content": text}}]}
+    yield {"choices": [{"delta": {}}]}
+
+
+class TestOpenai:
+    def test_system_prompt_reloaded_on_change(self, tmp_path):
+        path = tmp_path / "prompt.txt"
+        path.write_text("first")
+        assert Openai.get_system_prompt(str(path)) == "first"
+
+        with patch("builtins.open") as mock_open:
+            assert Openai.get_system_prompt(str(path)) == "first"
+            mock_open.assert_not_called()
+
+        path.write_text("second")
+        os.utime(path, (0, path.stat().st_mtime + 10))
+        assert Openai.get_system_prompt(str(path)) == "second"
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_generate_response_stats(self, mock_create, _):
+        mock_create.return_value = events("###TITLE:", " Title")
+        model = get_generator("test_prompt.txt")
+        stats = GenerationStats()
+
+        assert model.generate_response("input", stats=stats) == "###TITLE: Title"
+        assert get_generator("test_prompt.txt") is model
+        assert stats.tokens == 2
+        assert stats.time_to_first_token is not None
+        assert mock_create.call_args.kwargs["messages"][0]["content"] == "prompt"
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_concurrent_streams_have_own_stats(self, mock_create, _):
+        mock_create.side_effect = [events("a"), events("b", "c", "d")]
+        model = get_generator("test_prompt.txt")
+        first, second = GenerationStats(), GenerationStats()
+
+        first_stream = model.stream_response("input", stats=first)
+        second_stream = model.stream_response("input", stats=second)
+        next(first_stream)
+        list(second_stream)
+        list(first_stream)
+
+        assert (first.tokens, second.tokens) == (1, 3)
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_run_openai_generation_stats(self, mock_create, _):
+        mock_create.return_value = events("a", "b")
+        stats = GenerationStats()
+
+        assert run_openai_generation("input", "stats.txt", stats=stats) == "ab"
+        assert stats.tokens == 2
+
+    def test_api_session_per_thread(self):
+        with patch("src.openai_generation.openai.requestssession", None):
+            get_generator("test_prompt.txt")
+            factory = openai.requestssession
+            assert callable(factory)
+            assert factory() is not factory()
+
+
+class TestResponseCache:
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_cached_response_skips_the_api(self, mock_create, _):
+        cache = DiskCache(":memory:")
+        mock_create.side_effect = lambda **kwargs: events("###TITLE:", " Title")
+
+        assert run_openai_generation("input", "cache.txt", 0, cache) == SCRIPT[:15]
+        assert run_openai_generation("input", "cache.txt", 0, cache) == SCRIPT[:15]
+        assert mock_create.call_count == 1
+
+        # other attempts and inputs are generated
+        run_openai_generation("input", "cache.txt", 1, cache)
+        run_openai_generation("other", "cache.txt", 0, cache)
+        assert mock_create.call_count == 3
+
+    @patch("src.openai_generation.Openai.get_system_prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_prompt_change_misses(self, mock_create, mock_prompt):
+        cache = DiskCache(":memory:")
+        mock_create.side_effect = lambda **kwargs: events("text")
+
+        mock_prompt.return_value = "prompt"
+        run_openai_generation("input", "cache.txt", 0, cache)
+        mock_prompt.return_value = "new prompt"
+        run_openai_generation("input", "cache.txt", 0, cache)
+        assert mock_create.call_count == 2
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_bypass_replaces_cached_response(self, mock_create, _):
+        cache = DiskCache(":memory:")
+        mock_create.side_effect = [events("old"), events("new")]
+
+        run_openai_generation("input", "cache.txt", 0, cache)
+        assert run_openai_generation("input", "cache.txt", 0, cache, True) == "new"
+        assert run_openai_generation("input", "cache.txt", 0, cache) == "new"
+        assert mock_create.call_count == 2
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_closed_stream_is_not_cached(self, mock_create, _):
+        cache = DiskCache(":memory:")
+        mock_create.side_effect = lambda **kwargs: events("a", "b")
+
+        with closing(stream_openai_generation("input", "cache.txt", 0, cache)) as s:
+            assert next(s) == "a"
+        assert get_generator("cache.txt").get_cached_response("input", cache) is None
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.Openai.stream_response")
+    def test_cached_candidate_wins(self, mock_stream_response, _):
+        cache = DiskCache(":memory:")
+        model = get_generator("cache.txt")
+        cache.set(model.cache_key("input", 1), SCRIPT.encode("utf-8"))
+
+        text, winner = run_concurrent_generation("input", "cache.txt", 3, 4, cache)
+
+        assert (text, winner) == (SCRIPT, 1)
+        mock_stream_response.assert_not_called()
+
+
+class TestReduceInput:
+    def test_bundled_prompt_without_custom_one(self, tmp_path):
+        with patch("src.openai_generation.cfg.OPENAI_PROMPTS_PATH", str(tmp_path)):
+            model = Openai(prompt="summarize.txt")
+        assert "Summarize" in model.system_prompt
+
+        (tmp_path / "summarize.txt").write_text("custom")
+        with patch("src.openai_generation.cfg.OPENAI_PROMPTS_PATH", str(tmp_path)):
+            assert Openai(prompt="summarize.txt").system_prompt == "custom"
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_short_input_is_unchanged(self, mock_create, _):
+        assert reduce_input("short input", 100, 50) == "short input"
+        mock_create.assert_not_called()
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_chunks_are_summarized_in_order(self, mock_create, _):
+        def create(messages, **kwargs):
+            # the summary of a chunk is its first word
+            return events(messages[1]["content"].split()[0])
+
+        mock_create.side_effect = create
+        text = "\n\n".join(f"part{i} " + "word " * 40 for i in range(4))
+
+        reduced = reduce_input(text, 100, 60, summary_tokens=10, workers=4)
+
+        assert reduced == "part0\n\npart1\n\npart2\n\npart3"
+        assert mock_create.call_count == 4
+        assert all(c.kwargs["max_tokens"] == 10 for c in mock_create.call_args_list)
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_summaries_are_reduced_until_they_fit(self, mock_create, _):
+        mock_create.side_effect = lambda messages, **kwargs: events(
+            messages[1]["content"][: len(messages[1]["content"]) // 2]
+        )
+        text = "\n\n".join("word " * 40 for _ in range(8))
+
+        reduced = reduce_input(text, 50, 60, workers=2)
+
+        assert count_tokens(reduced) <= 50
+        assert mock_create.call_count > 8
+
+    @patch("src.openai_generation.Openai.get_system_prompt", return_value="prompt")
+    @patch("src.openai_generation.openai.ChatCompletion.create")
+    def test_summaries_which_dont_shrink_stop(self, mock_create, _):
+        mock_create.side_effect = lambda messages, **kwargs: events(
+            messages[1]["content"] * 2
+        )
+        text = "word " * 100
+
+        assert reduce_input(text, 50, 60) == text
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from src.pipeline import Pipeline, Stage
+
+
+class TestPipeline:
+    def test_run_all_stages(self):
+        pipeline = Pipeline(
+            [
+                Stage("double", lambda x: x * 2, workers=2),
+                Stage("increment", lambda x: x + 1, workers=3),
+            ],
+            queue_size=1,
+        )
+        assert sorted(pipeline.run(range(10))) == [x * 2 + 1 for x in range(10)]
+
+    def test_failed_items_are_dropped(self):
+        def fail_on_odd(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+
+        pipeline = Pipeline([Stage("filter", fail_on_odd, workers=2)])
+        assert sorted(pipeline.run(range(6))) == [0, 2, 4]
+
+    def test_retries(self):
+        calls = []
+
+        def flaky(x):
+            calls.append(x)
+            if len(calls) == 1:
+                raise RuntimeError("first call fails")
+            return x
+
+        pipeline = Pipeline([Stage("flaky", flaky, retries=1)])
+        assert pipeline.run([1]) == [1]
+        assert calls == [1, 1]
+
+    def test_stages_overlap(self):
+        # second item enters the first stage while the first one is in the second stage
+        first_started = threading.Event()
+        overlap = threading.Event()
+
+        def stage_one(x):
+            if x == 1 and first_started.wait(timeout=5):
+                overlap.set()
+            return x
+
+        def stage_two(x):
+            first_started.set()
+            if x == 0:
+                overlap.wait(timeout=5)
+            return x
+
+        pipeline = Pipeline(
+            [Stage("one", stage_one), Stage("two", stage_two)], queue_size=1
+        )
+        start = time.monotonic()
+        assert sorted(pipeline.run([0, 1])) == [0, 1]
+        assert overlap.is_set()
+        assert time.monotonic() - start < 5
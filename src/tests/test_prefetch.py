@@ -0,0 +1,80 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from src.prefetch import PREFETCH_RESULTS, ScriptPrefetcher
+from src.utils import Elem
+
+
+class TestScriptPrefetcher:
+    @patch("src.prefetch._search_yt_videos")
+    @patch("src.prefetch.get_storyblocks_video_urls")
+    def test_search(self, mock_storyblocks, mock_yt):
+        search_cache = MagicMock()
+        prefetcher = ScriptPrefetcher({}, 50, search_cache=search_cache)
+        future = prefetcher.add(Elem("query", "city night"))
+        future.result()
+        prefetcher.close()
+
+        mock_storyblocks.assert_called_once_with(
+            ["city", "night"], PREFETCH_RESULTS, {}, None, search_cache
+        )
+        mock_yt.assert_called_once_with("city night", search_cache)
+
+    @patch("src.prefetch._search_yt_videos")
+    @patch("src.prefetch.get_storyblocks_video_urls")
+    def test_search_only_used_sources(self, mock_storyblocks, mock_yt):
+        prefetcher = ScriptPrefetcher({}, 0, search_cache=MagicMock())
+        prefetcher.add(Elem("query", "city")).result()
+        prefetcher.close()
+
+        mock_storyblocks.assert_called_once()
+        mock_yt.assert_not_called()
+
+    @patch("nltk.sent_tokenize", side_effect=lambda text: text.split(". "))
+    @patch("src.prefetch.get_tts_engine")
+    def test_synthesize(self, mock_engine, _):
+        tts_cache = MagicMock()
+        mock_engine.return_value.synthesize.return_value = iter([])
+        prefetcher = ScriptPrefetcher({}, 0, tts_cache=tts_cache)
+        prefetcher.add(Elem("text", "One. Two.")).result()
+        prefetcher.close()
+
+        mock_engine.assert_called_once_with(tts_cache)
+        mock_engine.return_value.synthesize.assert_called_once_with(["One", "Two."])
+
+    def test_nothing_to_prefetch_without_caches(self):
+        prefetcher = ScriptPrefetcher({}, 50)
+        assert prefetcher.add(Elem("query", "city")) is None
+        assert prefetcher.add(Elem("text", "Text.")) is None
+        assert prefetcher.add(Elem("title", "Title")) is None
+        prefetcher.close()
+        assert prefetcher.futures == []
+
+    @patch("src.prefetch.get_storyblocks_video_urls", side_effect=OSError("offline"))
+    def test_failures_are_not_raised(self, _):
+        prefetcher = ScriptPrefetcher({}, 0, search_cache=MagicMock())
+        assert prefetcher.add(Elem("query", "city")).result() is None
+        prefetcher.close()
+
+    @patch("nltk.sent_tokenize", side_effect=lambda text: [text])
+    @patch("src.prefetch.get_tts_engine")
+    def test_cancel_drops_pending_prefetches(self, mock_engine, _):
+        started, release = threading.Event(), threading.Event()
+
+        def synthesize(sentences):
+            started.set()
+            release.wait(5)
+            return iter([])
+
+        mock_engine.return_value.synthesize.side_effect = synthesize
+        prefetcher = ScriptPrefetcher({}, 0, tts_cache=MagicMock())
+        running = prefetcher.add(Elem("text", "One."))
+        pending = prefetcher.add(Elem("text", "Two."))
+        started.wait(5)
+
+        prefetcher.cancel()
+        release.set()
+
+        assert pending.cancelled()
+        assert running.result(5) is None
+        mock_engine.return_value.synthesize.assert_called_once_with(["One."])
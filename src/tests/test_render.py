@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+from src.render import build_render_args, render_preview, render_video
+from src.timeline import TimelineClip
+
+
+class TestRender:
+    def test_build_render_args(self):
+        timeline = [
+            TimelineClip("0_0.mp4", 0, 0.0, 3.0, video_size=(1920, 1080), video_fps=30),
+            TimelineClip("1_0.mp4", 1, 3.0, 2.0, 1.5, (1280, 720), 25),
+        ]
+
+        args = build_render_args(timeline, "voiceover.wav", "out.mp4")
+
+        assert args[:9] == [
+            "-t",
+            "3.000",
+            "-i",
+            "0_0.mp4",
+            "-t",
+            "2.000",
+            "-i",
+            "1_0.mp4",
+            "-i",
+        ]
+        graph = args[args.index("-filter_complex") + 1].split(";")
+        # matching clips are not scaled or resampled
+        assert graph[0] == "[0:v]setsar=1[v0]"
+        assert "scale=1920:1080" in graph[1] and "fps=30" in graph[1]
+        assert "tpad=stop_mode=clone:stop_duration=1.500" in graph[1]
+        assert graph[2].startswith("[v0][v1]concat=n=2")
+        assert args.count("-c:v") == 1
+        assert args[-1] == "out.mp4"
+
+    @patch("src.render.run_ffmpeg")
+    def test_render_video_single_run(self, mock_run_ffmpeg):
+        timeline = [TimelineClip("0_0.mp4", 0, 0.0, 3.0)]
+
+        render_video(timeline, "voiceover.wav", "out.mp4")
+
+        mock_run_ffmpeg.assert_called_once()
+
+    @patch("src.render.run_ffmpeg")
+    def test_render_preview(self, mock_run_ffmpeg):
+        timeline = [TimelineClip("0_0.mp4", 0, 0.0, 3.0, video_size=(1920, 1080))]
+
+        render_preview(timeline, "voiceover.wav", "out.preview.mp4")
+
+        args = mock_run_ffmpeg.call_args.args[0]
+        assert "scale=640:360" in args[args.index("-filter_complex") + 1]
+        assert args[args.index("-preset") + 1] == "ultrafast"
+        assert args[args.index("-r") + 1] == 15
+
+    @patch("src.render.run_ffmpeg")
+    def test_render_video_segments(self, mock_run_ffmpeg, tmp_path):
+        timeline = [
+            TimelineClip("0_0.mp4", 0, 0.0, 3.0),
+            TimelineClip("0_1.mp4", 0, 3.0, 1.01),
+            TimelineClip("1_0.mp4", 1, 4.01, 2.0, 0.5),
+        ]
+
+        render_video(timeline, "voiceover.wav", tmp_path / "out.mp4", workers=2)
+
+        calls = [call.args[0] for call in mock_run_ffmpeg.call_args_list]
+        assert len(calls) == 3
+        segments, concat = calls[:2], calls[2]
+        assert [args.count("-i") for args in segments] == [2, 1]
+        # segments have no audio and exact frame counts
+        assert all("-c:a" not in args for args in segments)
+        assert [args[args.index("-frames:v") + 1] for args in segments] == [120, 75]
+        assert concat[concat.index("-c:v") + 1] == "copy"
+        assert "voiceover.wav" in concat
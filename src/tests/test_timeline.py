@@ -0,0 +1,107 @@
+import json
+import shutil
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+from src.timeline import TimelineClip, build_timeline, load_plan, save_plan
+from src.utils import Elem
+
+
+def video_info(duration):
+    return {"duration": duration, "video_size": [1920, 1080], "video_fps": 30.0}
+
+
+class TestBuildTimeline:
+    @patch("src.timeline.get_video_info")
+    @patch("src.timeline.sf.info", return_value=Mock(duration=10.0))
+    def test_build_timeline(self, mock_sf_info, mock_get_video_info, tmp_path):
+        mock_get_video_info.side_effect = lambda path: video_info(
+            {"0_0": 3.0, "0_1": 7.0, "1_0": 2.0}[Path(path).stem]
+        )
+        elements = [Elem("text", "One.", 0.4), Elem("text", "Two.", 0.6)]
+        video_paths = [
+            tmp_path / name for name in ("0_0.mp4", "0_1.mp4", "0_2.mp4", "1_0.mp4")
+        ]
+
+        timeline = build_timeline(
+            elements, str(tmp_path / "voiceover.wav"), video_paths
+        )
+
+        assert [(Path(c.path).stem, c.start, c.duration, c.hold) for c in timeline] == [
+            ("0_0", 0.0, 3.0, 0.0),
+            ("0_1", 3.0, 1.0, 0.0),
+            ("1_0", 4.0, 2.0, 4.0),
+        ]
+        # clips past the end of a paragraph are never probed
+        assert mock_get_video_info.call_count == 3
+        assert timeline[-1].end == 10.0
+        assert timeline[0] == TimelineClip(
+            str(video_paths[0]), 0, 0.0, 3.0, 0.0, (1920, 1080), 30.0
+        )
+
+    @patch("src.timeline.get_video_info")
+    @patch("src.timeline.sf.info", return_value=Mock(duration=10.0))
+    def test_build_timeline_first_paragraph_without_footage(
+        self, mock_sf_info, mock_get_video_info, tmp_path
+    ):
+        mock_get_video_info.side_effect = lambda path: video_info(
+            {"1_0": 3.0, "1_1": 4.0}[Path(path).stem]
+        )
+        elements = [Elem("text", "One.", 0.4), Elem("text", "Two.", 0.6)]
+        video_paths = [tmp_path / name for name in ("1_0.mp4", "1_1.mp4")]
+
+        timeline = build_timeline(
+            elements, str(tmp_path / "voiceover.wav"), video_paths
+        )
+
+        assert [(Path(c.path).stem, c.start, c.duration, c.hold) for c in timeline] == [
+            ("1_0", 0.0, 3.0, 0.0),
+            ("1_1", 3.0, 4.0, 3.0),
+        ]
+        assert timeline[-1].end == 10.0
+
+
+class TestPlan:
+    def test_save_and_load_plan(self, tmp_path):
+        timeline = [
+            TimelineClip("0_0.mp4", 0, 0.0, 3.0, 0.0, (1920, 1080), 30.0),
+            TimelineClip("1_0.mp4", 1, 3.0, 2.0, 1.5, (1280, 720), 25.0),
+        ]
+        plan_path = tmp_path / "video.plan.json"
+
+        save_plan(timeline, "voiceover.wav", plan_path)
+
+        assert json.loads(plan_path.read_text())["duration"] == 6.5
+        loaded_timeline, audio_path = load_plan(plan_path)
+        assert audio_path == str(Path("voiceover.wav").absolute())
+        assert [clip.path for clip in loaded_timeline] == [
+            str(Path(clip.path).absolute()) for clip in timeline
+        ]
+        assert [replace(clip, path="") for clip in loaded_timeline] == [
+            replace(clip, path="") for clip in timeline
+        ]
+
+    def test_plan_with_media_outlives_the_sources(self, tmp_path):
+        work_dir = tmp_path / "process"
+        work_dir.mkdir()
+        for name in ("0_0.mp4", "1_0.mp4", "voiceover.wav"):
+            (work_dir / name).write_bytes(name.encode())
+        timeline = [
+            TimelineClip(str(work_dir / "0_0.mp4"), 0, 0.0, 3.0),
+            TimelineClip(str(work_dir / "1_0.mp4"), 1, 3.0, 2.0),
+        ]
+        plan_path = tmp_path / "plans" / "video" / "plan.json"
+
+        save_plan(timeline, str(work_dir / "voiceover.wav"), plan_path, True)
+        shutil.rmtree(work_dir)
+        # the plan folder can be moved as a whole
+        moved_path = tmp_path / "moved" / "plan.json"
+        shutil.move(str(plan_path.parent), str(moved_path.parent))
+
+        loaded_timeline, audio_path = load_plan(moved_path)
+        assert Path(audio_path).read_bytes() == b"voiceover.wav"
+        assert [Path(clip.path).read_bytes() for clip in loaded_timeline] == [
+            b"0_0.mp4",
+            b"1_0.mp4",
+        ]
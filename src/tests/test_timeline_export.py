@@ -0,0 +1,59 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from src.timeline import TimelineClip
+from src.timeline_export import build_edl, export_timeline
+
+TIMELINE = [
+    TimelineClip("videos/0_0.mp4", 0, 0.0, 3.0),
+    TimelineClip("videos/0_1.mp4", 0, 3.0, 61.5, 0.5),
+]
+
+
+class TestTimelineExport:
+    def test_build_edl(self):
+        edl = build_edl(TIMELINE, "voiceover.wav", "video")
+
+        lines = edl.splitlines()
+        assert lines[0] == "TITLE: video"
+        assert lines[3].split() == [
+            "001",
+            "AX",
+            "V",
+            "C",
+            "00:00:00:00",
+            "00:00:03:00",
+            "00:00:00:00",
+            "00:00:03:00",
+        ]
+        assert lines[4] == "* FROM CLIP NAME: 0_0.mp4"
+        assert lines[6].split()[4:] == [
+            "00:00:00:00",
+            "00:01:01:15",
+            "00:00:03:00",
+            "00:01:04:15",
+        ]
+        # the voice-over covers the held frames too
+        assert lines[9].split()[2] == "A"
+        assert lines[9].split()[-1] == "00:01:05:00"
+
+    def test_export_fcp_xml(self, tmp_path):
+        output_path = tmp_path / "timeline.xml"
+
+        export_timeline(TIMELINE, "voiceover.wav", output_path)
+
+        sequence = ET.parse(output_path).getroot().find("sequence")
+        assert sequence.findtext("duration") == "1950"
+        clips = sequence.findall("media/video/track/clipitem")
+        assert [(c.findtext("start"), c.findtext("end")) for c in clips] == [
+            ("0", "90"),
+            ("90", "1935"),
+        ]
+        assert clips[1].findtext("file/pathurl").endswith("/videos/0_1.mp4")
+        audio = sequence.find("media/audio/track/clipitem")
+        assert audio.findtext("file/name") == "voiceover.wav"
+
+    def test_export_unknown_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            export_timeline(TIMELINE, "voiceover.wav", tmp_path / "timeline.otio")
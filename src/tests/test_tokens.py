@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from src.tokens import _warn_without_tiktoken, count_tokens, split_by_tokens
+
+
+class TestTokens:
+    @patch("src.tokens.tiktoken", None)
+    def test_count_tokens_without_tiktoken(self):
+        assert count_tokens("") == 0
+        assert count_tokens("abcd") == 1
+        assert count_tokens("abcde") == 2
+
+    @patch("src.tokens.tiktoken", None)
+    def test_heuristic_is_logged_once(self):
+        _warn_without_tiktoken.cache_clear()
+        with patch("src.tokens.logger") as mock_logger:
+            count_tokens("abcd")
+            count_tokens("abcde")
+        mock_logger.warning.assert_called_once()
+
+    def test_short_text_is_one_chunk(self):
+        assert split_by_tokens("  Short text.  ", 100) == ["Short text."]
+        assert split_by_tokens(" \n ", 100) == []
+
+    def test_chunks_fit_and_keep_the_text(self):
+        paragraphs = [
+            " ".join(f"Sentence {p}-{s} has some words." for s in range(20))
+            for p in range(5)
+        ]
+        text = "\n\n".join(paragraphs)
+
+        chunks = split_by_tokens(text, 200)
+
+        assert len(chunks) > 1
+        assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+        assert " ".join(" ".join(chunks).split()) == " ".join(text.split())
+
+    def test_paragraphs_are_not_split_if_they_fit(self):
+        paragraphs = ["a " * 100, "b " * 100, "c " * 100]
+
+        chunks = split_by_tokens("\n\n".join(paragraphs), 60)
+
+        assert [chunk.split()[0] for chunk in chunks] == ["a", "b", "c"]
+        assert all(len(set(chunk.split())) == 1 for chunk in chunks)
+
+    def test_long_line_is_split_by_sentences(self):
+        text = "First sentence here. Second sentence here. Third one."
+
+        chunks = split_by_tokens(text, 8)
+
+        assert chunks[0] == "First sentence here."
+        assert all(count_tokens(chunk) <= 8 for chunk in chunks)
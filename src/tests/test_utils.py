@@ -4,9 +4,13 @@ from unittest.mock import mock_open, patch
 
 from src.utils import (
     Elem,
+    ScriptParser,
     generate_video_meta,
     get_cookies,
+    get_paragraph_durations,
     get_source_files,
+    group_clips_by_paragraph,
+    is_valid_script,
     prep_directories,
     split_openai_output,
 )
@@ -52,6 +56,32 @@ class TestUtils:
         assert elements[4] == Elem("query", "Query Text 2")
         assert elements[5] == Elem("description", "Description Text")
 
+    def test_script_parser_matches_split_openai_output(self):
+        raw_text = (
+            "TITLE: Title Text "
+            "### TEXT: Text ### QUERY: Query Text "
+            "### TEXT: Text 2 ### QUERY: Query Text 2 "
+            "### DESCRIPTION: Description Text"
+        )
+        parser = ScriptParser()
+        elements = []
+        # separators split across chunks too
+        for i in range(0, len(raw_text), 4):
+            elements += parser.feed(raw_text[i : i + 4])
+        elements += parser.close()
+        expected = split_openai_output(raw_text)
+        assert [(e.type, e.text) for e in elements] == [
+            (e.type, e.text) for e in expected
+        ]
+
+    def test_script_parser_waits_for_separator(self):
+        parser = ScriptParser()
+        assert parser.feed("TITLE: Title ### TEXT: Te") == [Elem("title", "Title")]
+        assert parser.feed("xt #") == []
+        assert parser.feed("## QUERY: q") == [Elem("text", "Text")]
+        assert parser.close() == [Elem("query", "q")]
+        assert parser.close() == []
+
     def test_generate_video_meta(self, tmpdir):
         splitted_output = [
             Elem("title", "Title Text"),
@@ -71,3 +101,42 @@ class TestUtils:
     def test_prep_directories(self, mock_makedirs):
         prep_directories()
         assert mock_makedirs.call_count == 2
+
+    def test_get_paragraph_durations_from_timings(self, tmp_path):
+        elements = [Elem("text", "One.", 0.5), Elem("text", "Two.", 0.5)]
+        timings = {
+            "sample_rate": 100,
+            "samples": 1000,
+            "paragraphs": [
+                {"start": 0, "end": 300, "sentences": []},
+                {"start": 300, "end": 1000, "sentences": []},
+            ],
+        }
+        (tmp_path / "timings.json").write_text(json.dumps(timings))
+
+        durations = get_paragraph_durations(elements, 10, tmp_path / "voiceover.wav")
+
+        assert durations == [3, 7]
+
+    def test_get_paragraph_durations_without_timings(self, tmp_path):
+        elements = [
+            Elem("text", "One.", 0.25),
+            Elem("query", "q"),
+            Elem("text", "Two.", 0.75),
+        ]
+
+        durations = get_paragraph_durations(elements, 10, tmp_path / "voiceover.wav")
+
+        assert durations == [2.5, 7.5]
+
+    def test_group_clips_by_paragraph(self):
+        clips = group_clips_by_paragraph(["0_0.mp4", "0_1.mp4", "2_0.mp4"])
+
+        assert clips == {0: [Path("0_0.mp4"), Path("0_1.mp4")], 2: [Path("2_0.mp4")]}
+
+    def test_is_valid_script(self):
+        script = "###TITLE: Title ###TEXT: one two three ###QUERY: query"
+
+        assert is_valid_script(script, 5)
+        assert not is_valid_script(script, 50)
+        assert not is_valid_script("###TITLE: Title ###TEXT: ", 0)
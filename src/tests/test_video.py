@@ -0,0 +1,65 @@
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from src.config import EncodeProfile
+from src.utils import Elem
+from src.video import make_video
+
+
+def clip(duration):
+    video = MagicMock(duration=duration)
+    video.subclip.side_effect = lambda start, end: MagicMock(duration=end - start)
+    return video
+
+
+class TestMakeVideo:
+    @patch("src.video.concatenate_videoclips")
+    @patch("src.video.VideoFileClip")
+    @patch("src.video.AudioFileClip")
+    def test_make_video_trims_and_closes_clips(
+        self, mock_audio_clip, mock_video_clip, mock_concatenate, tmp_path
+    ):
+        mock_audio_clip.return_value.duration = 10.0
+        videos = {"0_0": clip(3.0), "0_1": clip(7.0), "1_0": clip(8.0)}
+        mock_video_clip.side_effect = lambda path: videos[Path(path).stem]
+        elements = [Elem("text", "One.", 0.4), Elem("text", "Two.", 0.6)]
+        video_paths = [
+            Path(name) for name in ("0_0.mp4", "0_1.mp4", "0_2.mp4", "1_0.mp4")
+        ]
+
+        make_video(elements, str(tmp_path / "voiceover.wav"), video_paths, "out.mp4")
+
+        # clips past the end of a paragraph are never opened
+        assert mock_video_clip.call_count == 3
+        videos["0_0"].subclip.assert_not_called()
+        videos["0_1"].subclip.assert_called_once_with(0, 1.0)
+        videos["1_0"].subclip.assert_called_once_with(0, 6.0)
+        for video in videos.values():
+            video.close.assert_called_once()
+        mock_audio_clip.return_value.close.assert_called_once()
+
+    @patch("src.video.concatenate_videoclips")
+    @patch("src.video.VideoFileClip")
+    @patch("src.video.AudioFileClip")
+    def test_make_video_uses_encode_profile(
+        self, mock_audio_clip, mock_video_clip, mock_concatenate, tmp_path
+    ):
+        mock_audio_clip.return_value.duration = 2.0
+        mock_video_clip.return_value = clip(3.0)
+        profile = EncodeProfile(
+            preset="veryfast", crf=28, fps=24, width=1280, height=720
+        )
+
+        make_video(
+            [Elem("text", "One.", 1.0)],
+            str(tmp_path / "voiceover.wav"),
+            [Path("0_0.mp4")],
+            "out.mp4",
+            profile,
+        )
+
+        final_clip = mock_concatenate.return_value.set_audio.return_value
+        kwargs = final_clip.write_videofile.call_args.kwargs
+        assert (kwargs["preset"], kwargs["fps"]) == ("veryfast", 24)
+        assert "scale=1280:720" in kwargs["ffmpeg_params"][-1]
+        assert kwargs["ffmpeg_params"][:2] == ["-crf", "28"]
@@ -1,8 +1,16 @@
-from unittest.mock import Mock, patch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from pathlib import Path
+from unittest.mock import ANY, Mock, patch
 
+import pytest
+
+from src.cache import DiskCache
 from src.video_processing import (
     Elem,
     Video,
+    _part_path,
     download_storyblocks_video,
     get_storyblocks_video_urls,
     save_storyblocks,
@@ -48,6 +56,74 @@ class TestVideoFunctions:
         assert result[0].duration == 10
         assert result[0].url == "https://www.storyblocks.com/download/123"
 
+    @patch(
+        "src.video_processing.get_storyblocks_video_urls",
+        return_value=[
+            Video("Video 1", 10, "https://www.storyblocks.com/download/1"),
+            Video("Video 2", 10, "https://www.storyblocks.com/download/2"),
+        ],
+    )
+    @patch("src.video_processing.download_storyblocks_video")
+    def test_save_storyblocks_with_executor(
+        self, mock_download_storyblocks_video, mock_get_storyblocks_video_urls
+    ):
+        cookies = {}
+        with ThreadPoolExecutor(2) as executor:
+            save_storyblocks(cookies, 15, "output_dir", 1, "query", executor=executor)
+        assert sorted(
+            call.args for call in mock_download_storyblocks_video.call_args_list
+        ) == [
+            (
+                "https://www.storyblocks.com/download/1",
+                cookies,
+                "output_dir/videos/1_0.mp4",
+            ),
+            (
+                "https://www.storyblocks.com/download/2",
+                cookies,
+                "output_dir/videos/1_1.mp4",
+            ),
+        ]
+
+    @patch(
+        "src.video_processing.get",
+        return_value=Mock(
+            status_code=200,
+            json=lambda: {
+                "data": {
+                    "stockItems": [
+                        {
+                            "stockItem": {"title": "Video 1", "duration": 10},
+                            "stockItemFormats": [{"downloadUrl": "/download/123"}],
+                        }
+                    ]
+                }
+            },
+        ),
+    )
+    def test_get_storyblocks_video_urls_cached(self, mock_get):
+        search_cache = DiskCache(":memory:")
+        first = get_storyblocks_video_urls(["Query"], 1, {}, search_cache=search_cache)
+        second = get_storyblocks_video_urls(
+            ["query "], 1, {}, search_cache=search_cache
+        )
+        assert mock_get.call_count == 1
+        assert (
+            first
+            == second
+            == [Video("Video 1", 10, "https://www.storyblocks.com/download/123")]
+        )
+
+    @patch(
+        "src.video_processing.get",
+        return_value=Mock(status_code=200, json=lambda: {"data": {"stockItems": []}}),
+    )
+    def test_get_storyblocks_video_urls_empty_not_cached(self, mock_get):
+        search_cache = DiskCache(":memory:")
+        get_storyblocks_video_urls(["query"], 1, {}, search_cache=search_cache)
+        get_storyblocks_video_urls(["query"], 1, {}, search_cache=search_cache)
+        assert mock_get.call_count == 2
+
     @patch("src.video_processing.get_storyblocks_video_urls", return_value=[])
     @patch("src.video_processing.download_yt_video")
     def test_save_storyblocks_no_videos(
@@ -55,7 +131,23 @@ class TestVideoFunctions:
     ):
         cookies = {}
         save_storyblocks(cookies, 10, "output_dir", 1, "query")
-        mock_download_yt_video.assert_called_once_with(10, "output_dir", 1, "query")
+        mock_download_yt_video.assert_called_once_with(
+            10, "output_dir", 1, "query", search_cache=None, library=None
+        )
+
+    @patch("src.video_processing.get_storyblocks_video_urls", return_value=[])
+    @patch("src.video_processing.download_yt_video")
+    def test_save_storyblocks_fallback_on_yt_executor(
+        self, mock_download_yt_video, mock_get_storyblocks_video_urls
+    ):
+        threads = []
+        mock_download_yt_video.side_effect = lambda *args, **kwargs: threads.append(
+            threading.current_thread().name
+        )
+        with ThreadPoolExecutor(1, "yt") as yt_pool:
+            save_storyblocks({}, 10, "output_dir", 1, "query", yt_executor=yt_pool)
+
+        assert len(threads) == 1 and threads[0].startswith("yt")
 
     @patch(
         "src.video_processing.get_storyblocks_video_urls",
@@ -71,11 +163,16 @@ class TestVideoFunctions:
             "https://www.storyblocks.com/download/123",
             cookies,
             "output_dir/videos/1_0.mp4",
+            session=None,
         )
 
     @patch(
         "src.video_processing.get",
-        return_value=Mock(status_code=200, content=b"video_content"),
+        return_value=Mock(
+            status_code=200,
+            headers={"Content-Length": "13"},
+            iter_content=lambda chunk_size: [b"video_", b"content"],
+        ),
     )
     def test_download_storyblocks_video(self, mock_get, tmpdir):
         cookies = {}
@@ -86,15 +183,96 @@ class TestVideoFunctions:
         )
 
         mock_get.assert_called_once_with(
-            "https://www.storyblocks.com/download/123", cookies=cookies
+            "https://www.storyblocks.com/download/123",
+            cookies=cookies,
+            headers={},
+            stream=True,
         )
 
         assert output_path.exists()
+        assert not tmpdir.listdir(lambda p: p.ext == ".part")
 
         with open(output_path, "rb") as f:
             content = f.read()
         assert content == b"video_content"
 
+    @patch(
+        "src.video_processing.get",
+        return_value=Mock(
+            status_code=206,
+            headers={"Content-Length": "7", "Content-Range": "bytes 6-12/13"},
+            iter_content=lambda chunk_size: [b"content"],
+        ),
+    )
+    def test_download_storyblocks_video_resume(self, mock_get, tmpdir):
+        output_path = tmpdir.join("video.mp4")
+        tmpdir.join(Path(_part_path(output_path, "url")).name).write_binary(b"video_")
+
+        download_storyblocks_video("url", {}, str(output_path))
+
+        assert mock_get.call_args.kwargs["headers"] == {"Range": "bytes=6-"}
+        assert output_path.read_binary() == b"video_content"
+
+    @patch("src.video_processing.get")
+    def test_download_storyblocks_video_resume_wrong_offset(self, mock_get, tmpdir):
+        mock_get.side_effect = [
+            Mock(
+                status_code=206,
+                headers={"Content-Length": "9", "Content-Range": "bytes 4-12/13"},
+                iter_content=lambda chunk_size: [b"o_content"],
+            ),
+            Mock(
+                status_code=200,
+                headers={"Content-Length": "13"},
+                iter_content=lambda chunk_size: [b"video_content"],
+            ),
+        ]
+        output_path = tmpdir.join("video.mp4")
+        tmpdir.join(Path(_part_path(output_path, "url")).name).write_binary(b"video_")
+
+        download_storyblocks_video("url", {}, str(output_path))
+
+        assert mock_get.call_args_list[1].kwargs["headers"] == {}
+        assert output_path.read_binary() == b"video_content"
+
+    @patch(
+        "src.video_processing.get",
+        return_value=Mock(
+            status_code=200,
+            headers={"Content-Length": "7"},
+            iter_content=lambda chunk_size: [b"BBBBBBB"],
+        ),
+    )
+    def test_download_storyblocks_video_part_of_another_url(self, mock_get, tmpdir):
+        output_path = tmpdir.join("video.mp4")
+        # a retry picked another clip for the same slot
+        other_part = tmpdir.join(Path(_part_path(output_path, "url_a")).name)
+        other_part.write_binary(b"AAAAAA")
+
+        download_storyblocks_video("url_b", {}, str(output_path))
+
+        assert mock_get.call_args.kwargs["headers"] == {}
+        assert output_path.read_binary() == b"BBBBBBB"
+        assert not other_part.exists()
+
+    @patch(
+        "src.video_processing.get",
+        return_value=Mock(
+            status_code=200,
+            headers={"Content-Length": "13"},
+            iter_content=lambda chunk_size: [b"video_"],
+        ),
+    )
+    def test_download_storyblocks_video_incomplete(self, mock_get, tmpdir):
+        output_path = tmpdir.join("video.mp4")
+
+        with pytest.raises(HTTPException):
+            download_storyblocks_video("url", {}, str(output_path))
+
+        assert not output_path.exists()
+        part_path = Path(_part_path(output_path, "url"))
+        assert part_path.read_bytes() == b"video_"
+
     @patch("src.video_processing.download_yt_video")
     @patch("src.video_processing.save_storyblocks")
     def test_save_videos_by_storyblocks(
@@ -112,13 +290,22 @@ class TestVideoFunctions:
         save_videos(elements, total_duration, "output_dir", cookies, yt_proba)
         mock_download_yt_video.assert_not_called()
         mock_save_storyblocks.assert_called_with(
-            {}, 4.0, "output_dir", 1, "query_text2"
+            {},
+            4.0,
+            "output_dir",
+            1,
+            "query_text2",
+            executor=ANY,
+            yt_executor=ANY,
+            session=None,
+            search_cache=None,
+            library=None,
         )
         assert mock_save_storyblocks.call_count == 2
 
     @patch("src.video_processing.download_yt_video")
     @patch("src.video_processing.save_storyblocks")
-    def test_save_videos_by_storyblocks(
+    def test_save_videos_by_yt(
         self, mock_save_storyblocks: Mock, mock_download_yt_video
     ):
         elements = [
@@ -132,5 +319,7 @@ class TestVideoFunctions:
         yt_proba = 100
         save_videos(elements, total_duration, "output_dir", cookies, yt_proba)
         mock_save_storyblocks.assert_not_called()
-        mock_download_yt_video.assert_called_with(4.0, "output_dir", 1, "query_text2")
+        mock_download_yt_video.assert_called_with(
+            4.0, "output_dir", 1, "query_text2", search_cache=None, library=None
+        )
         assert mock_download_yt_video.call_count == 2
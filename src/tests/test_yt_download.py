@@ -1,6 +1,18 @@
+from dataclasses import replace
 from unittest.mock import MagicMock, Mock, patch
 
-from src.yt_download import download_yt_video, get_clips, get_random_subclip_start_times
+import pytest
+
+from src.cache import DiskCache
+from src.config import ENCODE_PROFILES
+from src.yt_download import (
+    _search_yt_videos,
+    copy_clips,
+    cut_clip_exact,
+    download_yt_video,
+    get_clips,
+    get_random_subclip_start_times,
+)
 
 
 class TestDownloadYTVideo:
@@ -15,7 +27,7 @@ class TestDownloadYTVideo:
         download_yt_video(7, file_output_dir, n_paragraph, query)
 
         mock_search_and_dl.assert_called_once_with(
-            query, f"{file_output_dir}/videos/yt"
+            query, f"{file_output_dir}/videos/yt/{n_paragraph}", None, None
         )
         mock_get_clips.assert_called_once_with(
             mock_search_and_dl.return_value, 1, 7, file_output_dir, n_paragraph
@@ -66,3 +78,210 @@ class TestGetRandomSubclipStartTimes:
                 for i in range(n_clips - 1)
             ]
         )
+
+
+class TestFastClipExtraction:
+    @patch("src.yt_download.copy_clips", autospec=True)
+    @patch(
+        "src.yt_download._random_subclip_start_times",
+        return_value=[10, 20],
+        autospec=True,
+    )
+    @patch("src.yt_download.get_video_info", return_value={"duration": 60})
+    @patch("src.yt_download.VideoFileClip", autospec=True)
+    def test_get_clips_copy_mode(
+        self, mock_video_clip, mock_video_info, mock_start_times, mock_copy_clips
+    ):
+        get_clips("test_video.mp4", 2, 7, "output_dir", 1, mode="copy")
+
+        mock_video_clip.assert_not_called()
+        mock_start_times.assert_called_once_with(60, 2, 7)
+        mock_copy_clips.assert_called_once_with(
+            "test_video.mp4",
+            [10, 20],
+            7,
+            ["output_dir/videos/1_0.mp4", "output_dir/videos/1_1.mp4"],
+        )
+
+    @patch("src.yt_download.cut_clip_exact", autospec=True)
+    @patch("src.yt_download.copy_clips", autospec=True)
+    @patch("src.yt_download._random_subclip_start_times", return_value=[])
+    @patch("src.yt_download.get_video_info", return_value={"duration": 60})
+    def test_get_clips_without_start_times(
+        self, mock_video_info, mock_start_times, mock_copy_clips, mock_cut_clip_exact
+    ):
+        get_clips("test_video.mp4", 2, 7, "output_dir", 1, mode="copy")
+        get_clips("test_video.mp4", 2, 7, "output_dir", 1, mode="exact")
+
+        mock_copy_clips.assert_not_called()
+        mock_cut_clip_exact.assert_not_called()
+
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    def test_copy_clips_single_run(self, mock_run_ffmpeg):
+        copy_clips("in.mp4", [10, 20], 7, ["a.mp4", "b.mp4"])
+
+        mock_run_ffmpeg.assert_called_once()
+        args = mock_run_ffmpeg.call_args.args[0]
+        assert args.count("-i") == 2
+        assert args[-1] == "b.mp4"
+        assert "copy" in args
+
+    @patch("src.yt_download.get_video_codec", return_value="h264")
+    @patch("src.yt_download.get_keyframe_times", return_value=[11.5, 13.5])
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    def test_cut_clip_exact_encodes_head_only(
+        self, mock_run_ffmpeg, mock_keyframes, mock_codec, tmpdir
+    ):
+        f_name = str(tmpdir.join("clip.mp4"))
+        cut_clip_exact("in.mp4", 10, 7, f_name)
+
+        head_args, tail_args, concat_args = (
+            call.args[0] for call in mock_run_ffmpeg.call_args_list
+        )
+        assert head_args[:4] == ["-ss", 10, "-t", 1.5]
+        assert "libx264" in head_args
+        # the head keeps the size and frame rate of the stream copied tail
+        assert "-vf" not in head_args and "-r" not in head_args
+        assert "libx264" not in tail_args and "copy" in tail_args
+        assert concat_args[-1] == f_name
+        assert tmpdir.listdir() == []
+
+    @patch("src.yt_download.get_keyframe_times", return_value=[])
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    def test_cut_clip_exact_without_keyframes(self, mock_run_ffmpeg, mock_keyframes):
+        cut_clip_exact("in.mp4", 10, 7, "clip.mp4")
+
+        mock_run_ffmpeg.assert_called_once()
+        assert "libx264" in mock_run_ffmpeg.call_args.args[0]
+
+    @patch("src.yt_download.get_video_codec", return_value="h264")
+    @patch("src.yt_download.get_keyframe_times", return_value=[11.5])
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    def test_cut_clip_exact_uses_encode_profile(
+        self, mock_run_ffmpeg, mock_keyframes, mock_codec, tmpdir
+    ):
+        f_name = str(tmpdir.join("clip.mp4"))
+        with patch("src.yt_download.cfg.ENCODE_PROFILE", "draft"):
+            cut_clip_exact("in.mp4", 10, 7, f_name)
+
+        head_args = mock_run_ffmpeg.call_args_list[0].args[0]
+        draft = ENCODE_PROFILES["draft"]
+        assert head_args[head_args.index("-preset") + 1] == draft.preset
+        assert head_args[head_args.index("-crf") + 1] == str(draft.crf)
+        assert head_args[head_args.index("-threads") + 1] == str(draft.threads)
+
+    @patch("src.yt_download.get_video_codec", return_value="h264")
+    @patch("src.yt_download.get_keyframe_times", return_value=[11.5])
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    def test_cut_clip_exact_other_codec_encodes_whole_clip(
+        self, mock_run_ffmpeg, mock_keyframes, mock_codec
+    ):
+        profile = replace(ENCODE_PROFILES["final"], codec="libx265")
+        cut_clip_exact("in.mp4", 10, 7, "clip.mp4", profile)
+
+        mock_run_ffmpeg.assert_called_once()
+        assert mock_run_ffmpeg.call_args.args[0][:4] == ["-ss", 10, "-t", 7]
+        assert "libx265" in mock_run_ffmpeg.call_args.args[0]
+
+
+class TestSegmentsDownload:
+    @patch("src.yt_download.copy_clips", autospec=True)
+    @patch(
+        "src.yt_download._random_subclip_start_times",
+        return_value=[100, 200],
+        autospec=True,
+    )
+    @patch("src.yt_download._find_yt_video", autospec=True)
+    def test_download_yt_video_segments(
+        self, mock_find_yt_video, mock_start_times, mock_copy_clips
+    ):
+        video, stream = Mock(length=600), Mock(url="https://googlevideo/stream")
+        mock_find_yt_video.return_value = (video, stream, None)
+
+        with patch("src.yt_download.cfg.YT_DOWNLOAD_MODE", "segments"), patch(
+            "src.yt_download.cfg.CLIP_EXTRACT_MODE", "copy"
+        ):
+            download_yt_video(10, "output_dir", 3, "test_query")
+
+        mock_start_times.assert_called_once_with(600, 2, 7)
+        mock_copy_clips.assert_called_once_with(
+            "https://googlevideo/stream",
+            [100, 200],
+            7,
+            ["output_dir/videos/3_0.mp4", "output_dir/videos/3_1.mp4"],
+        )
+        stream.download.assert_not_called()
+
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    @patch(
+        "src.yt_download._random_subclip_start_times",
+        return_value=[100, 200],
+        autospec=True,
+    )
+    @patch("src.yt_download._find_yt_video", autospec=True)
+    def test_download_yt_video_segments_reencode(
+        self, mock_find_yt_video, mock_start_times, mock_run_ffmpeg
+    ):
+        video, stream = Mock(length=600), Mock(url="https://googlevideo/stream")
+        mock_find_yt_video.return_value = (video, stream, None)
+
+        with patch("src.yt_download.cfg.YT_DOWNLOAD_MODE", "segments"), patch(
+            "src.yt_download.cfg.CLIP_EXTRACT_MODE", "reencode"
+        ), patch("src.yt_download.cfg.ENCODE_PROFILE", "draft"):
+            download_yt_video(10, "output_dir", 3, "test_query")
+
+        args = list(map(str, mock_run_ffmpeg.call_args.args[0]))
+        assert args.count("https://googlevideo/stream") == 2
+        assert "copy" not in args
+        assert args.count("libx264") == 2
+        assert args.count(ENCODE_PROFILES["draft"].scale_filter()) == 2
+        assert args[-1] == "output_dir/videos/3_1.mp4"
+
+    @pytest.mark.parametrize("mode", ["copy", "reencode", "exact"])
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    @patch("src.yt_download._find_yt_video", autospec=True)
+    def test_download_yt_video_segments_short_video(
+        self, mock_find_yt_video, mock_run_ffmpeg, mode
+    ):
+        # 14 seconds of clips don't fit the middle 80% of a 16 seconds video
+        video, stream = Mock(length=16), Mock(url="https://googlevideo/stream")
+        mock_find_yt_video.return_value = (video, stream, None)
+
+        with patch("src.yt_download.cfg.YT_DOWNLOAD_MODE", "segments"), patch(
+            "src.yt_download.cfg.CLIP_EXTRACT_MODE", mode
+        ):
+            download_yt_video(10, "output_dir", 3, "test_query")
+
+        mock_run_ffmpeg.assert_not_called()
+
+    @pytest.mark.parametrize("mode", ["copy", "reencode", "exact"])
+    @patch("src.yt_download.run_ffmpeg", autospec=True)
+    @patch(
+        "src.yt_download._random_subclip_start_times", return_value=[], autospec=True
+    )
+    @patch("src.yt_download._find_yt_video", autospec=True)
+    def test_download_yt_video_segments_no_start_times(
+        self, mock_find_yt_video, mock_start_times, mock_run_ffmpeg, mode
+    ):
+        video, stream = Mock(length=600), Mock(url="https://googlevideo/stream")
+        mock_find_yt_video.return_value = (video, stream, None)
+
+        with patch("src.yt_download.cfg.YT_DOWNLOAD_MODE", "segments"), patch(
+            "src.yt_download.cfg.CLIP_EXTRACT_MODE", mode
+        ):
+            download_yt_video(10, "output_dir", 3, "test_query")
+
+        mock_run_ffmpeg.assert_not_called()
+
+
+class TestSearchYTVideos:
+    @patch("src.yt_download.Search")
+    def test_empty_results_are_not_cached(self, mock_search):
+        search_cache = DiskCache(":memory:")
+        mock_search.return_value.results = []
+        assert _search_yt_videos("query", search_cache) == []
+
+        video = Mock(video_id="abc")
+        mock_search.return_value.results = [video]
+        assert _search_yt_videos("query", search_cache) == [video]
+        assert mock_search.call_count == 2
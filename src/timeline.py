@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import soundfile as sf
+
+from src.ffmpeg_utils import get_video_info
+from src.logger import logger
+from src.utils import Elem, get_paragraph_durations, group_clips_by_paragraph
+
+
+@dataclass
+class TimelineClip:
+    path: str
+    paragraph: int
+    start: float  # position on the timeline, seconds
+    duration: float  # seconds used from the beginning of the clip
+    hold: float = 0.0  # seconds the last frame is held when the footage runs out
+    video_size: Optional[Tuple[int, int]] = None
+    video_fps: Optional[float] = None
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration + self.hold
+
+
+def build_timeline(
+    elements: List[Elem],
+    audio_path: str,
+    video_paths: List[Union[str, Path]],
+) -> List[TimelineClip]:
+    """
+    Place the clips of every paragraph on the voice-over timeline.
+
+    Clips of a paragraph are used in order until the paragraph is covered, the last one
+    is trimmed. Only the used clips are probed. If the footage of a paragraph is too short,
+    the last frame of its last clip is held until the end of the paragraph.
+    Leading paragraphs without footage are covered by the clips of the first paragraph
+    with footage, so the video starts with the voice-over.
+
+    :param elements: Elements of the script.
+    :param audio_path: Path to the voice-over audio.
+    :param video_paths: Clips named `{n_paragraph}_{v_num}.mp4`, see `src.video.get_stock_videos`.
+    :return: Clips in timeline order.
+    """
+    durations = get_paragraph_durations(
+        elements, sf.info(audio_path).duration, audio_path
+    )
+    clips_by_paragraph = group_clips_by_paragraph(video_paths)
+    timeline = []
+    position = 0.0
+    for n_paragraph, paragraph_duration in enumerate(durations):
+        paragraph_end = position + paragraph_duration
+        if not timeline:
+            # nothing is placed yet, the clips start at the beginning of the audio
+            position = 0.0
+        for path in clips_by_paragraph.get(n_paragraph, []):
+            remaining = paragraph_end - position
+            if remaining <= 0:
+                break
+            info = get_video_info(path)
+            duration = min(info["duration"], remaining)
+            timeline.append(
+                TimelineClip(
+                    str(path),
+                    n_paragraph,
+                    position,
+                    duration,
+                    video_size=tuple(info["video_size"]),
+                    video_fps=info["video_fps"],
+                )
+            )
+            position += duration
+        if paragraph_end - position > 0:
+            if timeline:
+                timeline[-1].hold += paragraph_end - position
+            else:
+                logger.warning(f"No footage for paragraph {n_paragraph}")
+        position = paragraph_end
+    return timeline
+
+
+def save_plan(
+    timeline: List[TimelineClip],
+    audio_path: str,
+    output_path: Union[str, Path],
+    copy_media: bool = False,
+) -> None:
+    """
+    Save the timeline as a JSON render plan, to review the cut without rendering it.
+
+    :param timeline: Clips of the video, see `build_timeline`.
+    :param audio_path: Path to the voice-over audio.
+    :param output_path: Path of the JSON plan.
+    :param copy_media: Hardlink or copy the clips and the audio into a `media` folder
+        next to the plan, so it can be rendered after the working folders are removed.
+    """
+    plan_dir = Path(output_path).parent
+    os.makedirs(plan_dir, exist_ok=True)
+    if copy_media:
+        media_dir = plan_dir / "media"
+        os.makedirs(media_dir, exist_ok=True)
+        timeline = [
+            replace(clip, path=_store_media(clip.path, media_dir, f"{n}_", plan_dir))
+            for n, clip in enumerate(timeline)
+        ]
+        audio_path = _store_media(audio_path, media_dir, "", plan_dir)
+    else:
+        # the plan doesn't depend on the working directory it's loaded from
+        timeline = [
+            replace(clip, path=str(Path(clip.path).absolute())) for clip in timeline
+        ]
+        audio_path = str(Path(audio_path).absolute())
+    plan = {
+        "audio": audio_path,
+        "duration": timeline[-1].end if timeline else 0.0,
+        "clips": [asdict(clip) for clip in timeline],
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    logger.info(f"Render plan saved OK {output_path}")
+
+
+def load_plan(path: Union[str, Path]) -> Tuple[List[TimelineClip], str]:
+    """
+    Load a render plan saved by `save_plan`.
+
+    :param path: Path of the JSON plan, relative media paths are resolved against its folder.
+    :return: Clips of the video and the path to the voice-over audio.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    plan_dir = Path(path).parent
+    timeline = []
+    for clip in plan["clips"]:
+        if clip["video_size"] is not None:
+            clip["video_size"] = tuple(clip["video_size"])
+        clip["path"] = str(plan_dir / clip["path"])
+        timeline.append(TimelineClip(**clip))
+    return timeline, str(plan_dir / plan["audio"])
+
+
+def _store_media(
+    path: Union[str, Path], media_dir: Path, prefix: str, plan_dir: Path
+) -> str:
+    stored_path = media_dir / f"{prefix}{Path(path).name}"
+    if stored_path.exists():
+        os.remove(stored_path)
+    try:
+        os.link(path, stored_path)
+    except OSError:
+        # different file systems or no hardlink support
+        shutil.copyfile(path, stored_path)
+    return str(stored_path.relative_to(plan_dir))
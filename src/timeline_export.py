@@ -0,0 +1,153 @@
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from src.logger import logger
+from src.timeline import TimelineClip
+
+TIMELINE_FORMATS = ("edl", "xml")
+
+
+def export_timeline(
+    timeline: List[TimelineClip],
+    audio_path: str,
+    output_path: Union[str, Path],
+    fps: int = 30,
+    size: Tuple[int, int] = (1920, 1080),
+) -> None:
+    """
+    Export the timeline for import into an editor, the format is taken from the file suffix.
+
+    ".edl" writes a CMX 3600 EDL, ".xml" writes a Final Cut Pro 7 XML, which Premiere imports
+    with the sequence settings and media links. Held last frames are left as gaps.
+
+    :param timeline: Clips of the video, see `src.timeline.build_timeline`.
+    :param audio_path: Path to the voice-over audio.
+    :param output_path: Path of the exported file.
+    :param fps: Timebase of the sequence.
+    :param size: Sequence width and height, used by the XML export.
+    """
+    suffix = Path(output_path).suffix.lstrip(".")
+    if suffix == "edl":
+        content = build_edl(timeline, audio_path, Path(output_path).stem, fps)
+    elif suffix == "xml":
+        content = build_fcp_xml(timeline, audio_path, Path(output_path).stem, fps, size)
+    else:
+        raise ValueError(f"Unknown timeline format {suffix}, use {TIMELINE_FORMATS}")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    logger.info(f"Timeline saved OK {output_path}")
+
+
+def build_edl(
+    timeline: List[TimelineClip], audio_path: str, title: str, fps: int = 30
+) -> str:
+    """
+    Build a CMX 3600 EDL with a video event per clip and the voice-over on the audio track.
+
+    :return: EDL text.
+    """
+    lines = [f"TITLE: {title}", "FCM: NON-DROP FRAME", ""]
+    n_event = 0
+    for clip in timeline:
+        start, end = _frames(clip.start, fps), _frames(clip.start + clip.duration, fps)
+        n_event += 1
+        lines.append(
+            f"{n_event:03d}  AX       V     C        "
+            f"{_timecode(0, fps)} {_timecode(end - start, fps)} "
+            f"{_timecode(start, fps)} {_timecode(end, fps)}"
+        )
+        lines.append(f"* FROM CLIP NAME: {Path(clip.path).name}")
+        lines.append("")
+    audio_end = _frames(timeline[-1].end, fps) if timeline else 0
+    n_event += 1
+    lines.append(
+        f"{n_event:03d}  AX       A     C        "
+        f"{_timecode(0, fps)} {_timecode(audio_end, fps)} "
+        f"{_timecode(0, fps)} {_timecode(audio_end, fps)}"
+    )
+    lines.append(f"* FROM CLIP NAME: {Path(audio_path).name}")
+    return "\n".join(lines) + "\n"
+
+
+def build_fcp_xml(
+    timeline: List[TimelineClip],
+    audio_path: str,
+    title: str,
+    fps: int = 30,
+    size: Tuple[int, int] = (1920, 1080),
+) -> str:
+    """
+    Build a Final Cut Pro 7 XML (xmeml) sequence with a video track of the clips
+    and an audio track with the voice-over.
+
+    :return: XML text.
+    """
+    audio_end = _frames(timeline[-1].end, fps) if timeline else 0
+    root = ET.Element("xmeml", version="4")
+    sequence = ET.SubElement(root, "sequence", id="sequence-1")
+    _text(sequence, "name", title)
+    _text(sequence, "duration", audio_end)
+    sequence.append(_rate(fps))
+    media = ET.SubElement(sequence, "media")
+
+    video = ET.SubElement(media, "video")
+    characteristics = ET.SubElement(
+        ET.SubElement(video, "format"), "samplecharacteristics"
+    )
+    _text(characteristics, "width", size[0])
+    _text(characteristics, "height", size[1])
+    video_track = ET.SubElement(video, "track")
+    for n_clip, clip in enumerate(timeline, 1):
+        start, end = _frames(clip.start, fps), _frames(clip.start + clip.duration, fps)
+        video_track.append(_clipitem(n_clip, clip.path, "video", start, end, fps))
+
+    audio_track = ET.SubElement(ET.SubElement(media, "audio"), "track")
+    audio_track.append(
+        _clipitem(len(timeline) + 1, audio_path, "audio", 0, audio_end, fps)
+    )
+
+    ET.indent(root)
+    body = ET.tostring(root, encoding="unicode")
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE xmeml>\n{body}\n'
+
+
+def _clipitem(
+    n: int, path: str, media_type: str, start: int, end: int, fps: int
+) -> ET.Element:
+    clipitem = ET.Element("clipitem", id=f"clipitem-{n}")
+    _text(clipitem, "name", Path(path).name)
+    _text(clipitem, "duration", end - start)
+    clipitem.append(_rate(fps))
+    _text(clipitem, "start", start)
+    _text(clipitem, "end", end)
+    _text(clipitem, "in", 0)
+    _text(clipitem, "out", end - start)
+    file = ET.SubElement(clipitem, "file", id=f"file-{n}")
+    _text(file, "name", Path(path).name)
+    _text(file, "pathurl", Path(path).absolute().as_uri())
+    file.append(_rate(fps))
+    ET.SubElement(ET.SubElement(file, "media"), media_type)
+    return clipitem
+
+
+def _rate(fps: int) -> ET.Element:
+    rate = ET.Element("rate")
+    _text(rate, "timebase", fps)
+    _text(rate, "ntsc", "FALSE")
+    return rate
+
+
+def _text(parent: ET.Element, tag: str, value) -> None:
+    ET.SubElement(parent, tag).text = str(value)
+
+
+def _frames(seconds: float, fps: int) -> int:
+    return round(seconds * fps)
+
+
+def _timecode(frames: int, fps: int) -> str:
+    seconds, frame = divmod(frames, fps)
+    minutes, second = divmod(seconds, 60)
+    hours, minute = divmod(minutes, 60)
+    return f"{hours:02d}:{minute:02d}:{second:02d}:{frame:02d}"
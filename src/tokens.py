@@ -0,0 +1,91 @@
+import math
+import re
+from functools import lru_cache
+from typing import List
+
+from src.logger import logger
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+# paragraphs, lines, sentences and words, tried in this order
+_SEPARATORS = (
+    (r"\n\s*\n", "\n\n"),
+    (r"\n", "\n"),
+    (r"(?<=[.!?])\s+", " "),
+    (r"\s+", " "),
+)
+
+
+@lru_cache(maxsize=None)
+def _warn_without_tiktoken() -> None:
+    # logged once, counts are called for every piece of a split text
+    logger.warning(
+        "tiktoken isn't installed, token counts are estimated as 4 characters per token"
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """
+    Count tokens of the text for the model.
+
+    Uses tiktoken if it's installed, otherwise estimates 4 characters per token.
+
+    :param text: Text to count.
+    :param model: OpenAI model.
+    :return: Number of tokens.
+    """
+    if tiktoken is None:
+        _warn_without_tiktoken()
+        return math.ceil(len(text) / 4)
+    return len(_get_encoding(model).encode(text))
+
+
+def split_by_tokens(
+    text: str, max_tokens: int, model: str = "gpt-4", level: int = 0
+) -> List[str]:
+    """
+    Split the text into chunks of at most `max_tokens` tokens.
+
+    Chunks end on paragraph boundaries where possible, then on lines, sentences
+    and words. Token counts of the parts are summed, so a chunk can be a few
+    tokens off the exact count of its text.
+
+    :param text: Text to split.
+    :param max_tokens: Max tokens of a chunk.
+    :param model: OpenAI model.
+    :param level: Index of the first separator to try.
+    :return: Chunks in text order.
+    """
+    if not text.strip():
+        return []
+    if level == len(_SEPARATORS) or count_tokens(text, model) <= max_tokens:
+        # a single word longer than the limit is kept as is
+        return [text.strip()]
+    pattern, joiner = _SEPARATORS[level]
+    joiner_tokens = count_tokens(joiner, model)
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in re.split(pattern, text.strip()):
+        for part in split_by_tokens(piece, max_tokens, model, level + 1):
+            part_tokens = count_tokens(part, model)
+            if current and current_tokens + joiner_tokens + part_tokens > max_tokens:
+                chunks.append(joiner.join(current))
+                current, current_tokens = [], 0
+            if current:
+                current_tokens += joiner_tokens
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append(joiner.join(current))
+    return chunks
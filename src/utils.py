@@ -3,11 +3,13 @@ import os
 import shutil
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
 from src.config import cfg
 from src.logger import logger
 
+TIMINGS_FILE = "timings.json"  # timing map saved next to the voice-over
+
 
 @dataclass
 class Elem:
@@ -25,25 +27,144 @@ def split_openai_output(raw_text: str, sep: str = "###") -> list[Elem]:
     :return: A list of Elem objects representing the split text.
     """
     arr = [item.strip() for item in raw_text.split(sep)]
-    elements = []
-    for item in arr:
-        if item.startswith("TITLE:"):
-            elements.append(Elem("title", item[7:]))
-        elif item.startswith("TEXT:"):
-            elements.append(Elem("text", item[6:]))
-        elif item.startswith("QUERY:"):
-            elements.append(Elem("query", item[7:]))
-        elif item.startswith("DESCRIPTION:"):
-            elements.append(Elem("description", item[13:]))
+    elements = [element for element in map(_parse_section, arr) if element]
 
     total_text_len = sum((len(item.text) for item in elements if item.type == "text"))
     for element in elements:
-        if element.type == "text":
+        if element.type == "text" and total_text_len:
             element.percent = len(element.text) / total_text_len
 
     return elements
 
 
+def _parse_section(item: str) -> Optional[Elem]:
+    if item.startswith("TITLE:"):
+        return Elem("title", item[7:])
+    elif item.startswith("TEXT:"):
+        return Elem("text", item[6:])
+    elif item.startswith("QUERY:"):
+        return Elem("query", item[7:])
+    elif item.startswith("DESCRIPTION:"):
+        return Elem("description", item[13:])
+    return None
+
+
+class ScriptParser:
+    """
+    Incremental version of `split_openai_output` for streamed LLM output.
+
+    A section is complete once the next separator arrives, the last one when the stream ends.
+    Elements have no `percent`, it's known only for the whole scenario.
+    """
+
+    def __init__(self, sep: str = "###"):
+        self.sep = sep
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> List[Elem]:
+        """
+        Add a chunk of the stream.
+
+        :param chunk: Next part of the scenario.
+        :return: Elements of the sections completed by the chunk.
+        """
+        self._buffer += chunk
+        *complete, self._buffer = self._buffer.split(self.sep)
+        return [e for e in (_parse_section(i.strip()) for i in complete) if e]
+
+    def close(self) -> List[Elem]:
+        """
+        End the stream.
+
+        :return: Element of the last section, if any.
+        """
+        element = _parse_section(self._buffer.strip())
+        self._buffer = ""
+        return [element] if element else []
+
+
+def is_valid_script(raw_text: str, min_words: int = 0) -> bool:
+    """
+    Check that LLM output is a usable script.
+
+    :param raw_text: The scenario received from LLM, possibly still being generated.
+    :param min_words: Min number of words of the scenario.
+    :return: True if the scenario has enough words, a title, and text and query sections.
+    """
+    if len(raw_text.split()) < min_words:
+        return False
+    types = {item.type for item in split_openai_output(raw_text)}
+    return {"title", "text", "query"} <= types
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so that equal queries produce equal cache keys.
+
+    :param query: Search query.
+    :return: Lower-cased query with collapsed whitespace.
+    """
+    return " ".join(query.lower().split())
+
+
+def load_timings(audio_path: Union[str, Path]) -> Optional[dict]:
+    """
+    Load the timing map saved next to the voice-over by `src.audio.generate_voice_over`.
+
+    The map holds "sample_rate", total "samples" and "paragraphs", every paragraph has
+    "start" and "end" samples and "sentences" with their "text", "start" and "end".
+
+    :param audio_path: Path to the voice-over audio.
+    :return: The timing map or None if there is none.
+    """
+    path = Path(audio_path).with_name(TIMINGS_FILE)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_paragraph_durations(
+    elements: List[Elem], total_duration: float, audio_path: Union[str, Path]
+) -> List[float]:
+    """
+    Get the voice-over duration of every text paragraph.
+
+    Durations come from the timing map of the voice-over, paragraphs are estimated
+    from their share of the text length if there is no matching map.
+
+    :param elements: Elements of the script.
+    :param total_duration: Duration of the voice-over in seconds.
+    :param audio_path: Path to the voice-over audio.
+    :return: Duration of every paragraph in seconds.
+    """
+    paragraphs = [item for item in elements if item.type == "text"]
+    timings = load_timings(audio_path)
+    if timings is not None and len(timings["paragraphs"]) == len(paragraphs):
+        return [
+            (paragraph["end"] - paragraph["start"]) / timings["sample_rate"]
+            for paragraph in timings["paragraphs"]
+        ]
+    if timings is not None:
+        logger.warning(f"Timing map of {audio_path} doesn't match the script")
+    return [item.percent * total_duration for item in paragraphs]
+
+
+def group_clips_by_paragraph(
+    video_paths: List[Union[str, Path]]
+) -> Dict[int, List[Path]]:
+    """
+    Group clips named `{n_paragraph}_{v_num}.mp4` by paragraph, keeping their order.
+
+    :param video_paths: Paths to the clips, see `src.video.get_stock_videos`.
+    :return: Clips of every paragraph.
+    """
+    clips = {}
+    for path in map(Path, video_paths):
+        clips.setdefault(int(path.stem.split("_")[0]), []).append(path)
+    return clips
+
+
 def generate_video_meta(splitted_output: list, file_output_dir: str):
     logger.info("Generating video meta...")
     os.makedirs(f"{file_output_dir}/videos", exist_ok=True)
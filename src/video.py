@@ -3,8 +3,9 @@ from typing import List, Union
 
 from moviepy.editor import AudioFileClip, VideoFileClip, concatenate_videoclips
 
+from src.config import ENCODE_PROFILES, EncodeProfile
 from src.logger import logger
-from src.utils import Elem
+from src.utils import Elem, get_paragraph_durations, group_clips_by_paragraph
 
 
 def get_stock_videos(folder: Union[str, Path]) -> List[Union[str, Path]]:
@@ -30,11 +31,32 @@ def get_audio(folder: Union[str, Path]) -> str:
     return [str(item) for item in Path(folder).iterdir() if item.suffix == ".wav"][0]
 
 
+def get_write_params(profile: EncodeProfile) -> dict:
+    """
+    Get `write_videofile` parameters encoding with the given profile.
+
+    :param profile: Encoding settings, the video is letterboxed to the profile size.
+    :return: Keyword arguments of moviepy's `write_videofile`.
+    """
+    return {
+        "codec": profile.codec,
+        "audio_codec": profile.audio_codec,
+        "fps": profile.fps,
+        "preset": profile.preset,
+        "threads": profile.threads or None,
+        "ffmpeg_params": [
+            *("-crf", str(profile.crf), "-pix_fmt", profile.pix_fmt),
+            *("-vf", profile.scale_filter()),
+        ],
+    }
+
+
 def make_video(
     elements: List[Elem],
     audio_path: str,
     video_paths: List[Union[str, Path]],
     output_path: Union[str, Path],
+    profile: EncodeProfile = ENCODE_PROFILES["final"],
 ) -> None:
     """
     Create a video by combining elements, audio, and video clips.
@@ -43,42 +65,48 @@ def make_video(
     :param audio_path: The path to the audio file to be used in the video.
     :param video_paths: A list of video paths to be included in the video.
     :param output_path: The path where the final video will be saved.
+    :param profile: Encoding settings of the video.
 
     :return: None
     """
     logger.info("Assembling video...")
     # Load audio clip
     audio = AudioFileClip(audio_path)
-    # Calculate duration for each paragraph
-    durations = [
-        item.percent * audio.duration for item in elements if item.type == "text"
-    ]
-
-    final_clips = []
-    for paragraph_n, paragraph_duration in enumerate(durations):
-        paragraph_clips = []
-        videos = [
-            VideoFileClip(str(path))
-            for path in video_paths
-            if int(path.stem.split("_")[0]) == paragraph_n
-        ]
-        for video in videos:
-            # if remainder paragraph_duration <= duration of next video,
-            # cut it to paragraph_duration remainder
-            if paragraph_duration <= video.duration:
-                video.set_duration(paragraph_duration)
-            paragraph_clips.append(video)
-            paragraph_duration -= video.duration
-            if paragraph_duration <= 0:
-                break
-
-        paragraph_clip = concatenate_videoclips(paragraph_clips, method="compose")
-        final_clips.append(paragraph_clip)
-
-    final_clip = concatenate_videoclips(final_clips, method="compose")
-
-    # Set audio for the final clip
-    final_clip = final_clip.set_audio(audio)
-
-    # Write the final video file
-    final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac", fps=30)
+    opened = [audio]
+    try:
+        # Calculate duration for each paragraph
+        durations = get_paragraph_durations(elements, audio.duration, audio_path)
+        clips_by_paragraph = group_clips_by_paragraph(video_paths)
+
+        final_clips = []
+        for paragraph_n, paragraph_duration in enumerate(durations):
+            paragraph_clips = []
+            # clips are opened only when they are needed
+            for path in clips_by_paragraph.get(paragraph_n, []):
+                if paragraph_duration <= 0:
+                    break
+                video = VideoFileClip(str(path))
+                opened.append(video)
+                # cut the last clip to the paragraph_duration remainder
+                if paragraph_duration < video.duration:
+                    video = video.subclip(0, paragraph_duration)
+                paragraph_clips.append(video)
+                paragraph_duration -= video.duration
+
+            if paragraph_clips:
+                paragraph_clip = concatenate_videoclips(
+                    paragraph_clips, method="compose"
+                )
+                final_clips.append(paragraph_clip)
+
+        final_clip = concatenate_videoclips(final_clips, method="compose")
+
+        # Set audio for the final clip
+        final_clip = final_clip.set_audio(audio)
+
+        # Write the final video file
+        final_clip.write_videofile(str(output_path), **get_write_params(profile))
+    finally:
+        # stop ffmpeg reader processes
+        for clip in opened:
+            clip.close()
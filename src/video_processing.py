@@ -1,17 +1,25 @@
-from dataclasses import dataclass
+import glob
+import hashlib
+import os
+import re
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from http.client import HTTPException
 from pathlib import Path
 from random import randint, sample
-from typing import Union
+from typing import Optional, Union
 
-from requests import get
+from requests import Session, get
 
+from src.cache import DiskCache
+from src.footage_library import FootageLibrary
 from src.logger import logger
-from src.utils import Elem
+from src.utils import Elem, get_paragraph_durations, normalize_query
 from src.yt_download import download_yt_video
 
 STORYBLOCKS_BASE_URL = "https://www.storyblocks.com"
 STORYBLOCKS_SEARCH_URL = f"{STORYBLOCKS_BASE_URL}/api/video/search"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 @dataclass
@@ -22,8 +30,22 @@ class Video:
 
 
 def get_storyblocks_video_urls(
-    search_terms: list[str], n_results: int, cookies: dict
+    search_terms: list[str],
+    n_results: int,
+    cookies: dict,
+    session: Optional[Session] = None,
+    search_cache: Optional[DiskCache] = None,
 ) -> list[Video]:
+    """
+    Search videos on Storyblocks and pick random `n_results` of them.
+
+    :param search_terms: Words of the search query.
+    :param n_results: Number of videos to return.
+    :param cookies: Cookies required for Storyblocks authentication.
+    :param session: Pooled HTTP session, a new connection is opened if not set.
+    :param search_cache: Cache of search results, Storyblocks is always queried if not set.
+    :return: A list of found videos.
+    """
     query_n_results = max(n_results, 10)
     params = {
         "categories": "",
@@ -40,23 +62,34 @@ def get_storyblocks_video_urls(
         "has_talent_released": "",
         "has_property_released": "",
     }
-    response = get(STORYBLOCKS_SEARCH_URL, params=params, cookies=cookies)
-    if response.status_code != 200:
-        raise HTTPException(f"Bad status code {response.status_code}")
-
-    n_results = min(n_results, len(response.json()["data"]["stockItems"]))
-
-    return sample(
-        [
+    cache_key = DiskCache.make_key(
+        "storyblocks",
+        normalize_query(" ".join(search_terms)),
+        {key: value for key, value in params.items() if key != "searchTerm"},
+    )
+    cached = search_cache.get_json(cache_key) if search_cache is not None else None
+    if cached is not None:
+        logger.info(f"Storyblocks search cache hit: {search_terms}")
+        videos = [Video(**item) for item in cached]
+    else:
+        response = _get(STORYBLOCKS_SEARCH_URL, cookies, session, params=params)
+        if response.status_code != 200:
+            raise HTTPException(f"Bad status code {response.status_code}")
+        videos = [
             Video(
                 item["stockItem"]["title"],
                 int(item["stockItem"]["duration"]),
                 f'{STORYBLOCKS_BASE_URL}{item["stockItemFormats"][-1]["downloadUrl"]}',
             )
             for item in response.json()["data"]["stockItems"]
-        ],
-        n_results,
-    )
+        ]
+        # "nothing found" isn't cached, results may appear later
+        if search_cache is not None and videos:
+            search_cache.set_json(cache_key, [asdict(video) for video in videos])
+
+    n_results = min(n_results, len(videos))
+
+    return sample(videos, n_results)
 
 
 def save_videos(
@@ -65,28 +98,74 @@ def save_videos(
     file_output_dir: Union[str, Path],
     cookies: dict,
     yt_proba: int,
+    storyblocks_workers: int = 1,
+    yt_workers: int = 1,
+    session: Optional[Session] = None,
+    search_cache: Optional[DiskCache] = None,
+    library: Optional[FootageLibrary] = None,
 ) -> None:
     """
     Save videos based on the provided `elements` and their durations.
 
+    Paragraphs are collected concurrently, each video source has its own pool of workers.
+    Output files keep the `{n_paragraph}_{v_num}.mp4` layout regardless of completion order.
+
     :param elements: A list of `Elem` objects representing the elements.
     :param total_duration: The total duration in seconds.
     :param file_output_dir: The directory where the videos will be saved.
     :param cookies: A `CookieJar` object containing the necessary cookies for authentication.
     :param yt_proba: Probability to use YouTube as a video source in percent
+    :param storyblocks_workers: Max concurrent Storyblocks searches and max concurrent clip downloads.
+    :param yt_workers: Max concurrent YouTube paragraphs.
+    :param session: Pooled HTTP session for Storyblocks requests, see `src.http_session`.
+    :param search_cache: Cache of Storyblocks and YouTube search results.
+    :param library: Library of previously downloaded footage.
 
     :return: None
     """
     logger.info("Start video collection...")
     queries = [item.text for item in elements if item.type == "query"]
-    durations = [
-        item.percent * total_duration for item in elements if item.type == "text"
-    ]
-    for n_paragraph, (query, duration) in enumerate(zip(queries, durations)):
-        if randint(0, 100) <= yt_proba:
-            download_yt_video(duration, file_output_dir, n_paragraph, query)
-        else:
-            save_storyblocks(cookies, duration, file_output_dir, n_paragraph, query)
+    durations = get_paragraph_durations(
+        elements, total_duration, f"{file_output_dir}/voiceover.wav"
+    )
+    storyblocks_pool = ThreadPoolExecutor(storyblocks_workers, "storyblocks")
+    yt_pool = ThreadPoolExecutor(yt_workers, "yt")
+    download_pool = ThreadPoolExecutor(storyblocks_workers, "storyblocks-dl")
+    futures = []
+    try:
+        for n_paragraph, (query, duration) in enumerate(zip(queries, durations)):
+            if randint(0, 100) <= yt_proba:
+                future = yt_pool.submit(
+                    download_yt_video,
+                    duration,
+                    file_output_dir,
+                    n_paragraph,
+                    query,
+                    search_cache=search_cache,
+                    library=library,
+                )
+            else:
+                future = storyblocks_pool.submit(
+                    save_storyblocks,
+                    cookies,
+                    duration,
+                    file_output_dir,
+                    n_paragraph,
+                    query,
+                    executor=download_pool,
+                    yt_executor=yt_pool,
+                    session=session,
+                    search_cache=search_cache,
+                    library=library,
+                )
+            futures.append(future)
+        # re-raise the first failure, if any
+        for future in futures:
+            future.result()
+    finally:
+        for pool in (storyblocks_pool, yt_pool, download_pool):
+            pool.shutdown(cancel_futures=True)
+    logger.info("Video collection finished")
 
 
 def save_storyblocks(
@@ -95,6 +174,11 @@ def save_storyblocks(
     file_output_dir: str,
     n_paragraph: int,
     query: str,
+    executor: Optional[Executor] = None,
+    session: Optional[Session] = None,
+    search_cache: Optional[DiskCache] = None,
+    library: Optional[FootageLibrary] = None,
+    yt_executor: Optional[Executor] = None,
 ) -> None:
     """
     Save videos from Storyblocks or fallback to saving from YouTube.
@@ -109,13 +193,28 @@ def save_storyblocks(
     :type n_paragraph: int
     :param query: The search query for videos.
     :type query: str
+    :param executor: Executor to download the clips concurrently, clips are downloaded one by one if not set.
+    :type executor: Optional[Executor]
+    :param session: Pooled HTTP session, a new connection is opened for every request if not set.
+    :type session: Optional[Session]
+    :param search_cache: Cache of Storyblocks and YouTube search results.
+    :type search_cache: Optional[DiskCache]
+    :param library: Library of previously downloaded footage, clips are always downloaded if not set.
+    :type library: Optional[FootageLibrary]
+    :param yt_executor: Executor of the YouTube fallback, so it counts against the YouTube workers. Runs in the calling thread if not set.
+    :type yt_executor: Optional[Executor]
     :return: None
     """
     videos: list[Video] = get_storyblocks_video_urls(
-        query.split(), int(duration / 5), cookies
+        query.split(), int(duration / 5), cookies, session, search_cache
     )
     if not videos:
-        download_yt_video(duration, file_output_dir, n_paragraph, query)
+        args = (duration, file_output_dir, n_paragraph, query)
+        kwargs = {"search_cache": search_cache, "library": library}
+        if yt_executor is None:
+            download_yt_video(*args, **kwargs)
+        else:
+            yt_executor.submit(download_yt_video, *args, **kwargs).result()
         return
     # drop less relevant videos from the end, if sum duration is enough without them
     while (
@@ -124,26 +223,147 @@ def save_storyblocks(
     ):
         videos.pop()
     # iterate through urls and save them in video folder
+    downloads = []
     for v_num, url in enumerate((video.url for video in videos)):
         v_path = f"{file_output_dir}/videos/{n_paragraph}_{v_num}.mp4"
-        download_storyblocks_video(url, cookies, v_path)
+        if executor is None:
+            _save_storyblocks_clip(url, cookies, v_path, session, library)
+        else:
+            downloads.append(
+                executor.submit(
+                    _save_storyblocks_clip, url, cookies, v_path, session, library
+                )
+            )
+    for download in downloads:
+        download.result()
 
 
-def download_storyblocks_video(url: str, cookies: dict, path: Union[str, Path]) -> None:
+def _save_storyblocks_clip(
+    url: str,
+    cookies: dict,
+    path: str,
+    session: Optional[Session] = None,
+    library: Optional[FootageLibrary] = None,
+) -> None:
+    if library is None:
+        download_storyblocks_video(url, cookies, path, session=session)
+        return
+    library.fetch(
+        f"storyblocks:{url}",
+        path,
+        lambda p: download_storyblocks_video(url, cookies, p, session=session),
+    )
+
+
+def download_storyblocks_video(
+    url: str,
+    cookies: dict,
+    path: Union[str, Path],
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    session: Optional[Session] = None,
+) -> None:
     """
     Downloads a video from the specified URL using the provided cookies and saves it to the given file path.
 
+    The video is streamed in chunks into a `.part` file next to `path`, which is renamed to `path`
+    once its size matches the Content-Length. A `.part` file left by an interrupted download
+    of the same URL is resumed with an HTTP Range request. Part files are named by a hash
+    of the URL, so a retry which picked another clip for `path` starts from scratch.
+
     :param url: The URL of the video to download.
     :type url: str
     :param cookies: A dictionary containing cookies required for authentication, if needed.
     :type cookies: dict
     :param path: The path where the downloaded video will be saved.
     :type path: Union[Path, str]
+    :param chunk_size: Size in bytes of the chunks written to disk.
+    :type chunk_size: int
+    :param session: Pooled HTTP session, a new connection is opened if not set.
+    :type session: Optional[Session]
     :return: None
     """
-    response = get(url, cookies=cookies)
-    if response.status_code != 200:
-        raise HTTPException(f"Bad status code {response.status_code}")
+    part_path = _part_path(path, url)
+    for stale_path in glob.glob(f"{glob.escape(str(path))}.*.part"):
+        # left by another clip chosen for the same slot
+        if stale_path != part_path:
+            os.remove(stale_path)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    response = _get(url, cookies, session, headers=headers, stream=True)
+    try:
+        if response.status_code == 416:
+            # the part file doesn't match the remote file anymore, start over
+            logger.warning(f"Can't resume {part_path}, downloading from scratch")
+            os.remove(part_path)
+            return download_storyblocks_video(url, cookies, path, chunk_size, session)
+        if response.status_code == 206 and _get_range_start(response.headers) != offset:
+            # appending a range from another position would corrupt the file
+            logger.warning(f"Server ignored the resume offset of {part_path}")
+            os.remove(part_path)
+            return download_storyblocks_video(url, cookies, path, chunk_size, session)
+        if response.status_code == 206:
+            mode = "ab"
+            expected_size = _get_total_size(response.headers, offset)
+        elif response.status_code == 200:
+            mode, offset = "wb", 0
+            expected_size = _get_total_size(response.headers, 0)
+        else:
+            raise HTTPException(f"Bad status code {response.status_code}")
+
+        if offset:
+            logger.info(f"Resuming {path} from byte {offset}")
+        with open(part_path, mode) as file:
+            for chunk in response.iter_content(chunk_size):
+                file.write(chunk)
+    finally:
+        response.close()
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        # keep the part file, next call resumes it
+        raise HTTPException(
+            f"Incomplete download {url}: got {size} of {expected_size} bytes"
+        )
+    os.replace(part_path, path)
+
+
+def _part_path(path: Union[str, Path], url: str) -> str:
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return f"{path}.{digest}.part"
+
+
+def _get(url: str, cookies: dict, session: Optional[Session] = None, **kwargs):
+    if session is None:
+        return get(url, cookies=cookies, **kwargs)
+    # the session already carries the cookies
+    return session.get(url, **kwargs)
+
+
+def _get_range_start(headers) -> Optional[int]:
+    """
+    Get the position of the first byte of a 206 response body.
+
+    :param headers: Response headers.
+    :return: Start of the Content-Range or None if the header is missing or malformed.
+    """
+    match = re.match(r"bytes (\d+)-", headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
 
-    with open(path, "wb") as file:
-        file.write(response.content)
+def _get_total_size(headers, offset: int) -> Optional[int]:
+    """
+    Get the full size of the downloaded file from the response headers.
+
+    :param headers: Response headers.
+    :param offset: Position of the first byte in the response body.
+    :return: Size in bytes or None if it can't be known.
+    """
+    if headers.get("Content-Encoding", "identity") != "identity":
+        # Content-Length is the size of the encoded body
+        return None
+    content_range = headers.get("Content-Range")
+    if content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    if headers.get("Content-Length") is not None:
+        return offset + int(headers["Content-Length"])
+    return None
@@ -1,16 +1,40 @@
+import os
 import shutil
 from pathlib import Path
 from random import randint
 from typing import Optional, Union
 
 from moviepy.editor import VideoFileClip
-from pytube import Search, Stream
+from pytube import Search, Stream, YouTube
 from pytube.exceptions import VideoUnavailable
 
+from src.cache import DiskCache
+from src.config import EncodeProfile, cfg
+from src.ffmpeg_utils import (
+    get_keyframe_times,
+    get_video_codec,
+    get_video_info,
+    run_ffmpeg,
+    write_concat_list,
+)
+from src.footage_library import FootageLibrary
 from src.logger import logger
+from src.utils import normalize_query
+from src.video import get_write_params
 
+CLIP_EXTRACT_MODES = ("reencode", "copy", "exact")
+# keyframe timestamps are printed rounded, seek slightly after them to land on the keyframe
+KEYFRAME_EPS = 0.001
 
-def download_yt_video(duration, file_output_dir, n_paragraph, query) -> None:
+
+def download_yt_video(
+    duration,
+    file_output_dir,
+    n_paragraph,
+    query,
+    search_cache: Optional[DiskCache] = None,
+    library: Optional[FootageLibrary] = None,
+) -> None:
     """
     Save video and clips from YouTube.
 
@@ -18,17 +42,30 @@ def download_yt_video(duration, file_output_dir, n_paragraph, query) -> None:
     :param file_output_dir: The directory where the videos will be saved.
     :param n_paragraph Number of paragraph in process.
     :param query Search query.
+    :param search_cache: Cache of search results, YouTube is always searched if not set.
+    :param library: Library of previously downloaded videos, videos are always downloaded if not set.
     :return: None
     """
-    # download full yt video for paragraph and get path to file
-    v_path = _search_and_dl_yt_video(query, f"{file_output_dir}/videos/yt")
     n = int(duration // 7 + bool(duration % 7))
+    if cfg.YT_DOWNLOAD_MODE == "segments":
+        _search_and_dl_yt_segments(
+            query, n, 7, file_output_dir, n_paragraph, search_cache, library
+        )
+        return
+    # download full yt video for paragraph and get path to file
+    # every paragraph has its own folder, so paragraphs can be downloaded concurrently
+    v_path = _search_and_dl_yt_video(
+        query, f"{file_output_dir}/videos/yt/{n_paragraph}", search_cache, library
+    )
     # extract 7 sec clips
     get_clips(v_path, n, 7, file_output_dir, n_paragraph)
 
 
 def _search_and_dl_yt_video(
-    search_query: str, folder: Union[Path, str]
+    search_query: str,
+    folder: Union[Path, str],
+    search_cache: Optional[DiskCache] = None,
+    library: Optional[FootageLibrary] = None,
 ) -> Optional[str]:
     """
     Search for a YouTube video using the given query and download it.
@@ -37,17 +74,115 @@ def _search_and_dl_yt_video(
     :type search_query: str
     :param folder: The folder path where the video will be saved.
     :type folder: Union[Path, str]
+    :param search_cache: Cache of search results, YouTube is always searched if not set.
+    :type search_cache: Optional[DiskCache]
+    :param library: Library of previously downloaded videos, videos are always downloaded if not set.
+    :type library: Optional[FootageLibrary]
     :returns Path to the saved video
     :rtype str
     """
-    search = Search(search_query)
-    if len(search.results) == 0:
-        logger(f"No video found by query: {search_query}")
+    found = _find_yt_video(search_query, search_cache, library)
+    if found is None:
+        return None
+    v, stream, stored_path = found
+    if stored_path is not None:
+        return stored_path
+    v_path = stream.download(folder, f"{v.title}.mp4", "yt_")
+    if library is not None:
+        library.add(f"youtube:{v.video_id}", v_path)
+    return v_path
+
+
+def _search_and_dl_yt_segments(
+    search_query: str,
+    n_clips: int,
+    clips_duration: Union[int, float],
+    output_folder: str,
+    n_paragraph: int,
+    search_cache: Optional[DiskCache] = None,
+    library: Optional[FootageLibrary] = None,
+) -> None:
+    """
+    Search for a YouTube video and download only the subclips used from it.
+
+    Subclip start times are chosen from the video length before downloading, then ffmpeg
+    reads just these windows of the remote stream with HTTP range requests.
+    The windows are stream copied or encoded according to `CLIP_EXTRACT_MODE`.
+    A video already stored in the library is cut locally instead.
+
+    :param search_query: The query to search for on YouTube.
+    :param n_clips: The number of subclips to extract.
+    :param clips_duration: The duration of each subclip in seconds.
+    :param output_folder: The path to the folder where the subclips will be saved.
+    :param n_paragraph: Number of the paragraph to collect clips for.
+    :param search_cache: Cache of search results, YouTube is always searched if not set.
+    :param library: Library of previously downloaded videos.
+    """
+    found = _find_yt_video(search_query, search_cache, library)
+    if found is None:
+        return
+    v, stream, stored_path = found
+    if stored_path is not None:
+        get_clips(stored_path, n_clips, clips_duration, output_folder, n_paragraph)
+        return
+    # subclips start within the middle 80% of the video, see _random_subclip_start_times
+    if n_clips * clips_duration > v.length * 0.8:
+        logger.error(
+            f"80% of video duration {v.length} isn't enough for {n_clips} clips by {clips_duration} seconds"
+        )
+        return
+    subclip_start_times = _random_subclip_start_times(v.length, n_clips, clips_duration)
+    if not subclip_start_times:
+        # the error is already logged
+        return
+    f_names = [
+        f"{output_folder}/videos/{n_paragraph}_{i}.mp4"
+        for i in range(len(subclip_start_times))
+    ]
+    if cfg.CLIP_EXTRACT_MODE == "exact":
+        for t_start, f_name in zip(subclip_start_times, f_names):
+            cut_clip_exact(
+                stream.url, t_start, clips_duration, f_name, cfg.get_encode_profile()
+            )
+    elif cfg.CLIP_EXTRACT_MODE == "copy":
+        copy_clips(stream.url, subclip_start_times, clips_duration, f_names)
+    else:
+        encode_clips(
+            stream.url,
+            subclip_start_times,
+            clips_duration,
+            f_names,
+            cfg.get_encode_profile(),
+        )
+    logger.info(f"FILES SAVED: {f_names}")
+
+
+def _find_yt_video(
+    search_query: str,
+    search_cache: Optional[DiskCache] = None,
+    library: Optional[FootageLibrary] = None,
+) -> Optional[tuple]:
+    """
+    Find the first usable YouTube video for the query.
+
+    :param search_query: The query to search for on YouTube.
+    :param search_cache: Cache of search results, YouTube is always searched if not set.
+    :param library: Library of previously downloaded videos.
+    :return: A tuple of the video, its 1080p stream and its path in the library.
+             The stream is None if the video is in the library, the path is None otherwise.
+             None if no usable video was found.
+    """
+    results = _search_yt_videos(search_query, search_cache)
+    if len(results) == 0:
+        logger.error(f"No video found by query: {search_query}")
         return None
 
-    # immediately add more videos
-    search.get_next_results()
-    for v in search.results:
+    for v in results:
+        if library is not None:
+            stored_path = library.lookup(f"youtube:{v.video_id}")
+            if stored_path is not None:
+                logger.info(f"Footage library hit: {v.video_id}")
+                return v, None, str(stored_path)
         try:
             stream: Stream = v.streams.filter(
                 adaptive=True, res="1080p", file_extension="mp4"
@@ -56,7 +191,35 @@ def _search_and_dl_yt_video(
             logger.error(f"Error occurred at {v.title}: {e}")
             continue
         if stream:
-            return stream.download(folder, f"{v.title}.mp4", "yt_")
+            return v, stream, None
+    return None
+
+
+def _search_yt_videos(
+    search_query: str, search_cache: Optional[DiskCache] = None
+) -> list[YouTube]:
+    """
+    Search YouTube videos, using cached video IDs when available.
+
+    :param search_query: The query to search for on YouTube.
+    :param search_cache: Cache of search results, YouTube is always searched if not set.
+    :return: Found videos, first two pages of the search.
+    """
+    cache_key = DiskCache.make_key("youtube", normalize_query(search_query))
+    if search_cache is not None:
+        video_ids = search_cache.get_json(cache_key)
+        if video_ids is not None:
+            logger.info(f"YouTube search cache hit: {search_query}")
+            return [YouTube.from_id(video_id) for video_id in video_ids]
+
+    search = Search(search_query)
+    if len(search.results) > 0:
+        # immediately add more videos
+        search.get_next_results()
+    # "nothing found" isn't cached, results may appear later
+    if search_cache is not None and search.results:
+        search_cache.set_json(cache_key, [v.video_id for v in search.results])
+    return search.results
 
 
 def get_clips(
@@ -65,10 +228,19 @@ def get_clips(
     clips_duration: Union[int, float],
     output_folder: str,
     n_paragraph: int,
+    mode: Optional[str] = None,
+    profile: Optional[EncodeProfile] = None,
 ):
     """
     Extracts subclips from a video file based on the specified parameters.
 
+    Modes:
+        - "reencode": decode the video with moviepy and encode every subclip.
+        - "copy": stream copy all subclips with a single ffmpeg run, subclips start at the
+          keyframe preceding the chosen start time.
+        - "exact": stream copy from the first keyframe of a subclip and encode only
+          the part before it, so subclips start exactly at the chosen time.
+
     :param path: The path to the video file.
     :type path: str
     :param n_clips: The number of subclips to extract.
@@ -79,26 +251,56 @@ def get_clips(
     :type output_folder: str
     :param n_paragraph: Number of the paragraph to collect clips for.
     :type n_paragraph int
+    :param mode: Extraction mode, "reencode", "copy" or "exact". Defaults to `CLIP_EXTRACT_MODE` config.
+    :type mode: Optional[str]
+    :param profile: Encoding settings of the "reencode" and "exact" modes. Defaults to `ENCODE_PROFILE` config.
+    :type profile: Optional[EncodeProfile]
     """
-    with VideoFileClip(path) as main_clip:
-        if n_clips * clips_duration > main_clip.duration:
+    mode = mode or cfg.CLIP_EXTRACT_MODE
+    if mode not in CLIP_EXTRACT_MODES:
+        raise ValueError(f"Unknown clip extraction mode: {mode}")
+    if mode == "reencode":
+        write_params = get_write_params(profile or cfg.get_encode_profile())
+        with VideoFileClip(path) as main_clip:
+            if n_clips * clips_duration > main_clip.duration:
+                logger.error(
+                    f"80% of main_clip duration {main_clip.duration} isn't enough for {n_clips} clips by {clips_duration} seconds"
+                )
+                return
+            subclip_start_times = get_random_subclip_start_times(
+                main_clip, n_clips, clips_duration
+            )
+            for i, t_start in enumerate(subclip_start_times):
+                f_name = f"{output_folder}/videos/{n_paragraph}_{i}.mp4"
+                with main_clip.subclip(t_start, t_start + clips_duration) as new_clip:
+                    new_clip: VideoFileClip
+                    new_clip.write_videofile(f_name, **write_params)
+                    logger.info(f"FILE SAVED: {f_name}")
+    else:
+        duration = get_video_info(path)["duration"]
+        if n_clips * clips_duration > duration:
             logger.error(
-                f"80% of main_clip duration {main_clip.duration} isn't enough for {n_clips} clips by {clips_duration} seconds"
+                f"80% of main_clip duration {duration} isn't enough for {n_clips} clips by {clips_duration} seconds"
             )
             return
-        subclip_start_times = get_random_subclip_start_times(
-            main_clip, n_clips, clips_duration
+        subclip_start_times = _random_subclip_start_times(
+            duration, n_clips, clips_duration
         )
-        for i, t_start in enumerate(subclip_start_times):
-            f_name = f"{output_folder}/videos/{n_paragraph}_{i}.mp4"
-            with main_clip.subclip(t_start, t_start + clips_duration) as new_clip:
-                new_clip: VideoFileClip
-                new_clip.write_videofile(
-                    f_name, codec="libx264", audio_codec="aac", fps=30
-                )
-                logger.info(f"FILE SAVED: {f_name}")
+        if not subclip_start_times:
+            # the error is already logged
+            return
+        f_names = [
+            f"{output_folder}/videos/{n_paragraph}_{i}.mp4"
+            for i in range(len(subclip_start_times))
+        ]
+        if mode == "copy":
+            copy_clips(path, subclip_start_times, clips_duration, f_names)
+        else:
+            for t_start, f_name in zip(subclip_start_times, f_names):
+                cut_clip_exact(path, t_start, clips_duration, f_name, profile)
+        logger.info(f"FILES SAVED: {f_names}")
     try:
-        shutil.rmtree(f"{output_folder}/videos/yt")
+        shutil.rmtree(f"{output_folder}/videos/yt/{n_paragraph}")
     except Exception:
         pass
 
@@ -125,8 +327,14 @@ def get_random_subclip_start_times(
            seconds of the subclips. If not, an empty list is returned along with a message indicating that
            suitable subclip timings couldn't be found in the given number of tries.
     """
+    return _random_subclip_start_times(clip.duration, n_clips, clips_duration)
+
+
+def _random_subclip_start_times(
+    duration: float, n_clips: int, clips_duration: Union[int, float]
+) -> list:
     number_of_tries = 10_000
-    start, end = int(clip.duration * 0.1), int(clip.duration * 0.9 - clips_duration)
+    start, end = int(duration * 0.1), int(duration * 0.9 - clips_duration)
     for _ in range(number_of_tries):
         tup = sorted(randint(start, end) for _ in range(n_clips))
         if all([tup[i] + clips_duration <= tup[i + 1] for i in range(n_clips - 1)]):
@@ -137,3 +345,111 @@ def get_random_subclip_start_times(
             f"Somehow couldn't find suitable subclip timings in {number_of_tries} tries..."
         )
         return []
+
+
+def copy_clips(
+    path: str,
+    start_times: list,
+    clips_duration: Union[int, float],
+    f_names: list,
+) -> None:
+    """
+    Stream copy subclips of a video with a single ffmpeg run.
+
+    Every subclip starts at the keyframe preceding its start time, no frames are encoded.
+
+    :param path: The path to the video file.
+    :param start_times: Start times of the subclips in seconds.
+    :param clips_duration: The duration of each subclip in seconds.
+    :param f_names: Output paths of the subclips.
+    """
+    args = []
+    for t_start in start_times:
+        args += ["-ss", t_start, "-t", clips_duration, "-i", path]
+    for i, f_name in enumerate(f_names):
+        args += ["-map", f"{i}:v:0", "-map", f"{i}:a?", "-c", "copy"]
+        args += ["-avoid_negative_ts", "make_zero", "-movflags", "+faststart", f_name]
+    run_ffmpeg(args)
+
+
+def encode_clips(
+    path: str,
+    start_times: list,
+    clips_duration: Union[int, float],
+    f_names: list,
+    profile: EncodeProfile,
+) -> None:
+    """
+    Encode subclips of a video with a single ffmpeg run.
+
+    Only the subclip windows are read, so the source can be a remote stream.
+
+    :param path: The path or URL of the video.
+    :param start_times: Start times of the subclips in seconds.
+    :param clips_duration: The duration of each subclip in seconds.
+    :param f_names: Output paths of the subclips.
+    :param profile: Encoding settings, subclips are letterboxed to the profile size.
+    """
+    args = []
+    for t_start in start_times:
+        args += ["-ss", t_start, "-t", clips_duration, "-i", path]
+    for i, f_name in enumerate(f_names):
+        args += ["-map", f"{i}:v:0", "-map", f"{i}:a?", "-vf", profile.scale_filter()]
+        args += [*profile.video_args(), "-r", profile.fps]
+        args += ["-c:a", profile.audio_codec, "-movflags", "+faststart", f_name]
+    run_ffmpeg(args)
+
+
+def cut_clip_exact(
+    path: str,
+    t_start: float,
+    clips_duration: Union[int, float],
+    f_name: str,
+    profile: Optional[EncodeProfile] = None,
+) -> None:
+    """
+    Cut a subclip starting exactly at `t_start` with as little encoding as possible.
+
+    Frames before the first keyframe of the subclip are encoded, the rest is stream copied.
+    Both parts are joined with the concat demuxer, which carries the codec parameters
+    of every part in-band.
+
+    :param path: The path to the video file.
+    :param t_start: Start time of the subclip in seconds.
+    :param clips_duration: The duration of the subclip in seconds.
+    :param f_name: Output path of the subclip.
+    :param profile: Encoder settings, `ENCODE_PROFILE` if None.
+    """
+    profile = profile or cfg.get_encode_profile()
+    t_end = t_start + clips_duration
+    keyframes = get_keyframe_times(path, t_start, t_end)
+    # the size, frame rate and pixel format of the source are kept, the encoded head
+    # must match the stream copied tail for the concat demuxer to join them
+    encode = ["-c:v", profile.codec, "-preset", profile.preset]
+    encode += ["-crf", str(profile.crf), "-threads", str(profile.threads)]
+    encode += ["-c:a", profile.audio_codec]
+    if keyframes and keyframes[0] - t_start <= KEYFRAME_EPS:
+        # starts on a keyframe already
+        args = ["-ss", t_start + KEYFRAME_EPS, "-t", clips_duration, "-i", path]
+        run_ffmpeg(args + ["-c", "copy", "-avoid_negative_ts", "make_zero", f_name])
+        return
+    if not keyframes or get_video_codec(path) != "h264" or "264" not in profile.codec:
+        # the subclip is a single partial GOP, or encoded parts can't be joined
+        run_ffmpeg(["-ss", t_start, "-t", clips_duration, "-i", path, *encode, f_name])
+        return
+
+    keyframe = keyframes[0]
+    head, tail = f"{f_name}.head.mkv", f"{f_name}.tail.mkv"
+    parts = f"{f_name}.parts.txt"
+    try:
+        run_ffmpeg(
+            ["-ss", t_start, "-t", keyframe - t_start, "-i", path, *encode, head]
+        )
+        args = ["-ss", keyframe + KEYFRAME_EPS, "-t", t_end - keyframe, "-i", path]
+        run_ffmpeg(args + ["-c", "copy", "-avoid_negative_ts", "make_zero", tail])
+        write_concat_list([head, tail], parts)
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", parts, "-c", "copy", f_name])
+    finally:
+        for tmp_file in (head, tail, parts):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)